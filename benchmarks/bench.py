@@ -0,0 +1,226 @@
+"""
+Бенчмарки google_analytics на локальной замене Analytics Reporting API (analyticsfake), без сети и ключей.
+
+    python benchmarks/bench.py                          # все замеры
+    python benchmarks/bench.py -k dump -k deque         # только совпадающие по имени
+    python benchmarks/bench.py --json new.json --baseline old.json --tolerance 0.25
+
+С --baseline сравнивает время с прошлым прогоном и завершается с кодом 1, если что-то замедлилось больше tolerance.
+Время и пиковая память снимаются в одном прогоне под tracemalloc, поэтому абсолютные значения завышены,
+но между прогонами сравнимы.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from datetime import date, timedelta
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google_analytics import analyticsbase  # noqa: E402
+from google_analytics.analyticsbase import (  # noqa: E402
+    DateDeque, GoogleAnalyticsBase, dump_to, limit_by, stream_by, updatable_dump_to)
+from google_analytics.analyticscolumns import decode_report  # noqa: E402
+from google_analytics.analyticsfake import FakeReportingService  # noqa: E402
+
+
+BENCHMARKS = {}
+BEGIN = date(2018, 1, 1)
+
+
+def benchmark(f):
+    BENCHMARKS[f.__name__] = f
+    return f
+
+
+def measure(f, *argp, **argn) -> dict:
+    tracemalloc.start()
+    started = perf_counter()
+    result = f(*argp, **argn)
+    seconds = perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"seconds": seconds, "peak_mb": peak / 2 ** 20, "result": result}
+
+
+class FakeAnalytics(GoogleAnalyticsBase):
+    def __init__(self, service: FakeReportingService, directory: str = "./", cache: bool = True) -> None:
+        super().__init__(directory=directory, dump_file_prefix="bench", cache=cache)
+        self.service = service
+        self.set_data_range(BEGIN, BEGIN + timedelta(29))
+
+    def _initialize_analytics_service(self, version: str = "v4"):
+        return self.service
+
+    def body(self, dimensions=("ga:date", "ga:source"), metrics=("ga:sessions", "ga:bounceRate")) -> dict:
+        return {'reportRequests': [{
+            'viewId': self.view_id,
+            'dateRanges': self.date_ranges,
+            'dimensions': [{'name': i} for i in dimensions],
+            'metrics': [{'expression': i} for i in metrics],
+            'pageToken': str(self.pageToken),
+            'pageSize': str(self.pageSize),
+        }]}
+
+    @limit_by(10000)
+    def all_rows(self):
+        return self.batch_get_requests(self.body())
+
+    @stream_by(10000)
+    def stream_rows(self):
+        return self.batch_get_requests(self.body())
+
+    @dump_to("rows")
+    def dumped_rows(self):
+        return self.all_rows()
+
+    @updatable_dump_to("days", incremental=True)
+    def updatable_days(self):
+        return self.fill_missing_dates(self.body())
+
+
+def large_service(args, **argn) -> FakeReportingService:
+    # args.rows строк за 30 дней, все наборы измерений в пределах дня различны
+    per_day = max(args.rows // 30, 1)
+    return FakeReportingService(rows_per_day=per_day, cardinality=per_day, **argn)
+
+
+@benchmark
+def batch_get_requests(args) -> dict:
+    analytics = FakeAnalytics(FakeReportingService(rows_per_day=10, latency=args.latency))
+    calls = 200
+    m = measure(lambda: [analytics.batch_get_requests(analytics.body()) for _ in range(calls)])
+    m["throughput"] = calls / m["seconds"]
+    return m
+
+
+@benchmark
+def batch_get_many(args) -> dict:
+    analytics = FakeAnalytics(FakeReportingService(rows_per_day=10, latency=max(args.latency, 0.02)))
+    bodies = [analytics.body() for _ in range(100)]
+    m = measure(analytics.batch_get_many, bodies, max_workers=8, qps=1000)
+    m["throughput"] = len(bodies) / m["seconds"]
+    return m
+
+
+@benchmark
+def limit_by_pagination(args) -> dict:
+    analytics = FakeAnalytics(large_service(args, latency=args.latency))
+    m = measure(lambda: len(analytics.all_rows()))
+    m["throughput"] = m["result"] / m["seconds"]
+    return m
+
+
+@benchmark
+def stream_by_pagination(args) -> dict:
+    analytics = FakeAnalytics(large_service(args, latency=args.latency))
+    m = measure(lambda: sum(1 for _ in analytics.stream_rows()))
+    m["throughput"] = m["result"] / m["seconds"]
+    return m
+
+
+@benchmark
+def decode_columns(args) -> dict:
+    analytics = FakeAnalytics(large_service(args))
+    pages = list(analytics.iter_pages(analytics.body()))
+    m = measure(lambda: len(decode_report(pages)))
+    m["throughput"] = m["result"] / m["seconds"]
+    return m
+
+
+@benchmark
+def dump_to_cache(args) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        analytics = FakeAnalytics(large_service(args), directory)
+        cold = measure(analytics.dumped_rows)
+        warm = measure(analytics.dumped_rows)
+    return {"seconds": cold["seconds"] + warm["seconds"], "peak_mb": max(cold["peak_mb"], warm["peak_mb"]),
+            "cold_seconds": cold["seconds"], "warm_seconds": warm["seconds"]}
+
+
+@benchmark
+def updatable_dump_to_incremental(args) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        analytics = FakeAnalytics(FakeReportingService(rows_per_day=20), directory)
+        analytics.set_data_range(BEGIN, BEGIN + timedelta(729))
+        full = measure(analytics.updatable_days)
+        analytics = FakeAnalytics(analytics.service, directory)
+        analytics.set_data_range(BEGIN, BEGIN + timedelta(730))
+        one_day = measure(analytics.updatable_days)
+    return {"seconds": one_day["seconds"], "peak_mb": one_day["peak_mb"], "full_seconds": full["seconds"]}
+
+
+@benchmark
+def date_deque(args) -> dict:
+    days = [BEGIN + timedelta(i) for i in range(3 * 365)]
+    data = DateDeque((i, None) for i in days if i.day != 15)
+
+    def probe():
+        hits = sum(1 for i in days if i in data)
+        hits += sum(1 for i in days if data.get_by_date(i) is not None)
+        missing = data.missing_dates(days[0], days[-1])
+        for i in missing:
+            data.insert_by_date((i, None))
+        return hits + len(missing) + len(data.range(days[100], days[200]))
+
+    m = measure(probe)
+    m["throughput"] = len(days) / m["seconds"]
+    return m
+
+
+@benchmark
+def import_time(args) -> dict:
+    # API и авторизация загружаются при первом обращении к API, а не при импорте (чтение кеша их не требует)
+    code = "import sys, time; t = time.perf_counter(); import google_analytics.analyticsbase; " \
+           "print(time.perf_counter() - t); " \
+           "print(sorted({m.split('.')[0] for m in sys.modules} & {'googleapiclient', 'oauth2client', 'httplib2'}))"
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env, check=True)
+    seconds, loaded = out.stdout.strip().splitlines()[-2:]
+    if loaded != "[]":
+        raise RuntimeError(f"import google_analytics.analyticsbase загружает {loaded}")
+    return {"seconds": float(seconds), "peak_mb": 0.0}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-k", dest="only", action="append", default=[], help="подстрока имени замера")
+    parser.add_argument("--rows", type=int, default=300000, help="строк в больших отчетах")
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа API, секунд")
+    parser.add_argument("--json", help="сохранить результаты в файл")
+    parser.add_argument("--baseline", help="сравнить с результатами прошлого прогона")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="допустимое замедление, доля")
+    args = parser.parse_args()
+
+    analyticsbase.logger.setLevel("ERROR")
+    results = {}
+    for name, f in BENCHMARKS.items():
+        if args.only and not any(i in name for i in args.only):
+            continue
+        result = f(args)
+        result.pop("result", None)
+        results[name] = result
+        extra = f"  {result['throughput']:>12.0f}/s" if "throughput" in result else ""
+        print(f"{name:<32} {result['seconds']:>9.3f} s {result['peak_mb']:>9.1f} MB{extra}")
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        slower = {name: (baseline[name]["seconds"], i["seconds"]) for name, i in results.items()
+                  if name in baseline and i["seconds"] > baseline[name]["seconds"] * (1 + args.tolerance)}
+        for name, (old, new) in slower.items():
+            print(f"REGRESSION {name}: {old:.3f} s -> {new:.3f} s")
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
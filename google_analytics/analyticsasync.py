@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import asyncio
+from copy import deepcopy
+
+from google_analytics.analyticsbase import GoogleAnalyticsBase, GoogleAnalyticsError, logger
+from google_analytics.analyticsmetrics import METRICS
+
+
+REPORTING_ENDPOINT = "https://analyticsreporting.googleapis.com/v4/reports:batchGet"
+
+
+class AsyncHttpError(GoogleAnalyticsError):
+    def __init__(self, status: int, content: str = "", headers: dict = None) -> None:
+        super().__init__(f"HTTP {status}: {content[:500]}")
+        self.status = status
+        self.content = content
+        self.headers = headers or {}
+
+
+def _aiohttp():
+    try:
+        import aiohttp
+    except ImportError as err:
+        raise ImportError("Для асинхронного API нужен aiohttp: pip install pysea-google-analytics[async]") from err
+    return aiohttp
+
+
+def async_connection_attempts(n=12, t=10, max_delay=300):  # конструктор декоратора (N,T залипает в замыкании)
+    """
+    Асинхронный аналог connection_attempts для корутин: пауза между попытками не блокирует цикл событий
+
+    :param n: количество повторов запроса
+    :param t: базовая задержка в секундах (на i'ом шаге до t*2^i)
+    :param max_delay: предельная задержка в секундах
+    :return:
+    """
+    def deco_connect(f):  # собственно декоратор принимающий корутину для декорирования
+        from google_analytics.analyticsretry import RetryPolicy
+        return RetryPolicy(retries=n, base_delay=t, max_delay=max_delay)(f)
+    return deco_connect
+
+
+class AsyncGoogleAnalyticsBase(GoogleAnalyticsBase):
+    """
+    Асинхронный клиент Analytics Reporting API v4 поверх aiohttp:
+    один цикл событий может параллельно выгружать много отчетов и представлений.
+
+    Настройки (view_id, периоды, кеширование) общие с GoogleAnalyticsBase,
+    асинхронные методы имеют префикс "a": abatch_get_requests, aiter_pages, aiter_rows, agather.
+    Состояние пагинации хранится в копии тела запроса, а не в self.pageToken,
+    поэтому одновременно можно листать несколько отчетов.
+
+    async with AsyncGoogleAnalyticsBase() as analytics:
+        async for row in analytics.aiter_rows(requests):
+            ...
+    """
+    def __init__(self, *argp, endpoint: str = REPORTING_ENDPOINT, access_token: str = None,
+                 timeout: float = 300, **argn) -> None:
+        super().__init__(*argp, **argn)
+        self.endpoint = endpoint
+        self.access_token = access_token  # если задан, используется вместо сервисного аккаунта
+        self.timeout = timeout
+        self.session = None
+
+    async def _token(self) -> str:
+        if self.access_token:
+            return self.access_token
+        from google_analytics.analyticsservice import FACTORY
+
+        # токен общий для процесса; обновление - сетевой вызов, уводим его из цикла событий
+        return await asyncio.get_running_loop().run_in_executor(
+            None, FACTORY.access_token, self._credentials_key(), self._get_credentials)
+
+    def _session(self):
+        if self.session is None or self.session.closed:
+            aiohttp = _aiohttp()
+            self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self.session
+
+    async def close(self) -> None:
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def __aenter__(self) -> AsyncGoogleAnalyticsBase:
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        await self.close()
+
+    @async_connection_attempts()
+    async def _post(self, requests: dict) -> dict:
+        # журнал квот - SQLite с блокировками и ожиданием, поэтому обращения к нему уводим из цикла событий
+        loop = asyncio.get_running_loop()
+        view_ids = {i.get('viewId', self.view_id) for i in requests["reportRequests"]}
+        if self.quota is not None:
+            await loop.run_in_executor(None, self.quota.before_request, view_ids)
+        headers = {"Authorization": f"Bearer {await self._token()}"}
+        async with self._session().post(self.endpoint, json=requests, headers=headers) as response:
+            if response.status >= 400:
+                raise AsyncHttpError(response.status, await response.text(), dict(response.headers))
+            result = await response.json()
+        if self.quota is not None:
+            await loop.run_in_executor(None, self.quota.after_response, view_ids, result)
+        return result
+
+    async def abatch_get_requests(self, requests: dict, golden_only: bool = False) -> dict:
+        """
+        Асинхронный аналог batch_get_requests: так же учитываются use_resource_quotas, result_cache,
+        квоты (quota, в _post) и замеры METRICS, кроме ga_response_bytes_total
+        """
+        if self.use_resource_quotas and "useResourceQuotas" not in requests:
+            requests = dict(requests, useResourceQuotas=True)  # тело вызывающего не меняем
+        labels = self._metric_labels(requests) if METRICS.enabled else {}
+        loop = asyncio.get_running_loop()
+
+        if self.result_cache is not None:
+            result = await loop.run_in_executor(None, self.result_cache.get, requests)
+            METRICS.incr("ga_result_cache_total", status="hit" if result is not None else "miss", **labels)
+            if result is not None:
+                logger.debug("Ответ взят из кеша по содержимому запроса")
+                return self._check_response(requests, result, golden_only)
+
+        with METRICS.timer("ga_batch_get_seconds", **labels):
+            result = await self._post(requests)
+        if METRICS.enabled:
+            METRICS.incr("ga_batch_get_total", **labels)
+            METRICS.incr("ga_rows_total", sum(len(i['data'].get('rows', [])) for i in result['reports']), **labels)
+        if self.result_cache is not None:
+            await loop.run_in_executor(None, self.result_cache.set, requests, result)
+        return self._check_response(requests, result, golden_only)
+
+    async def aiter_pages(self, requests: dict, golden_only: bool = False):
+        """
+        Асинхронный генератор страниц первого отчета запроса (по nextPageToken)
+        """
+        requests = deepcopy(requests)
+        while True:
+            result = await self.abatch_get_requests(requests, golden_only)
+            report = result['reports'][0]
+            yield report
+            if not report.get('nextPageToken', False):
+                return
+            requests["reportRequests"][0]["pageToken"] = report['nextPageToken']
+
+    async def aiter_rows(self, requests: dict, golden_only: bool = False):
+        """
+        Асинхронный генератор строк первого отчета запроса по всем страницам
+        """
+        async for report in self.aiter_pages(requests, golden_only):
+            for row in report['data'].get("rows", []):
+                yield row
+
+    async def agather(self, requests_list: list, golden_only: bool = False, limit: int = 10) -> list:
+        """
+        Выполняет запросы batchGet конкурентно, не более limit одновременно
+
+        :return: ответы в порядке запросов
+        """
+        semaphore = asyncio.Semaphore(limit)
+
+        async def bounded(requests):
+            async with semaphore:
+                return await self.abatch_get_requests(requests, golden_only)
+
+        return await asyncio.gather(*(bounded(i) for i in requests_list))
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, timedelta
+from time import time
+
+from google_analytics import analyticscache
+from google_analytics.analyticsbase import DateDeque, GoogleAnalyticsError, date_spans, logger
+from google_analytics.analyticsstore import DayPartitionStore
+
+
+def chunk_spans(begin: date, end: date, chunk_days: int) -> list:
+    """
+    Делит период [begin, end] на куски не длиннее chunk_days дней
+    """
+    spans, day = [], begin
+    while day <= end:
+        spans.append((day, min(day + timedelta(chunk_days - 1), end)))
+        day += timedelta(chunk_days)
+    return spans
+
+
+def _run_chunk(analytics_class, analytics_args: dict, requests, store: DayPartitionStore,
+               begin: date, end: date, golden_only: bool, quota_ledger: str) -> int:
+    # выполняется в рабочем процессе: догружает недостающие дни куска и сохраняет их по одному,
+    # дни с не golden данными не сохраняются (как в fill_missing_dates)
+    analytics = analytics_class(**analytics_args)
+    if quota_ledger:
+        analytics.quota_manager_enable(quota_ledger)
+    analytics.set_data_range(begin, end)
+
+    saved = 0
+    for span_begin, span_end in analytics._golden_spans(date_spans(store.missing_dates(begin, end))):
+        report = analytics._fetch_all_pages(analytics._requests_for_span(requests, span_begin, span_end), golden_only)
+        if not report['data'].get('isDataGolden', False):
+            continue
+        days = analytics.split_report_by_date(report, span_begin, span_end)
+        store.save_many(days)
+        saved += len(days)
+    return saved
+
+
+class BackfillScheduler:
+    """
+    Параллельная загрузка длинного периода по кускам в пуле процессов с контрольными точками.
+
+    Каждый кусок (chunk_days дней) выполняется отдельным процессом, каждый полученный день сразу атомарно
+    сохраняется в кеш по дням (DayPartitionStore, тот же, что у partitioned_dump_to(prefix)),
+    а кусок, все дни которого сохранены, отмечается файлом контрольной точки. После сбоя повторный run пропускает
+    завершенные куски и уже сохраненные дни незавершенных.
+    Дни с не golden данными не сохраняются: такие куски остаются незавершенными (self.incomplete)
+    и догружаются следующим запуском.
+    Квоты: число процессов ограничивает параллелизм, а quota_ledger включает общий для процессов
+    QuotaManager (analyticsquota).
+
+    scheduler = BackfillScheduler(MyAnalytics, requests, "sessions", "2018-01-01", "2020-12-31",
+                                  directory=directory, dump_file_prefix="my")
+    data = scheduler.run()
+
+    :param analytics_class: класс-наследник GoogleAnalyticsBase (должен импортироваться в рабочих процессах)
+    :param requests: шаблон тела batchGet с измерением ga:date или функция (begin, end) -> тело запроса
+                     уровня модуля (передается в процессы через pickle)
+    :param prefix: префикс кеша, как у partitioned_dump_to
+    :param analytics_args: аргументы конструктора analytics_class (directory, dump_file_prefix, ...)
+    """
+    def __init__(self, analytics_class, requests, prefix: str, begin, end, chunk_days: int = 30,
+                 processes: int = 4, golden_only: bool = False, quota_ledger: str = None, **analytics_args) -> None:
+        self.analytics_class = analytics_class
+        self.analytics_args = analytics_args
+        self.requests = requests
+        self.chunk_days = chunk_days
+        self.processes = processes
+        self.golden_only = golden_only
+        self.quota_ledger = quota_ledger
+
+        analytics = analytics_class(**analytics_args)
+        analytics.set_data_range(begin, end)
+        self.begin, self.end = analytics.begin_date, analytics.end_date
+        report_request = analytics._requests_for_span(requests, self.begin, self.end)["reportRequests"][0]
+        self.store = DayPartitionStore(analytics.directory, f"{analytics.dump_file_prefix}_{prefix}",
+                                       report_request.get('viewId', analytics.view_id),
+                                       analyticscache.query_fingerprint(report_request))
+        self.checkpoints = os.path.join(self.store.path, ".checkpoints")
+        self.incomplete = []  # куски с несохраненными днями после последнего run
+
+    def _checkpoint(self, begin: date, end: date) -> str:
+        return os.path.join(self.checkpoints, f"{begin.isoformat()}_{end.isoformat()}.done")
+
+    def chunks(self) -> list:
+        return chunk_spans(self.begin, self.end, self.chunk_days)
+
+    def pending(self) -> list:
+        """
+        Куски без контрольной точки
+        """
+        return [i for i in self.chunks() if not os.path.exists(self._checkpoint(*i))]
+
+    def run(self) -> DateDeque:
+        """
+        Загружает незавершенные куски и возвращает все дни периода из кеша по дням.
+        Куски, в которых остались несохраненные (не golden) дни, не отмечаются контрольной точкой
+        и перечисляются в self.incomplete.
+
+        :return: DateDeque за период
+        """
+        pending = self.pending()
+        logger.info(f"Backfill {self.begin} - {self.end}: {len(pending)} из {len(self.chunks())} кусков")
+        os.makedirs(self.checkpoints, exist_ok=True)
+
+        failed, self.incomplete = [], []
+        with ProcessPoolExecutor(max_workers=self.processes) as pool:
+            futures = {pool.submit(_run_chunk, self.analytics_class, self.analytics_args, self.requests, self.store,
+                                   begin, end, self.golden_only, self.quota_ledger): (begin, end)
+                       for begin, end in pending}
+            for future in as_completed(futures):
+                begin, end = futures[future]
+                try:
+                    saved = future.result()
+                except Exception as err:
+                    logger.error(f"Backfill {begin} - {end} не выполнен: {err}")
+                    failed.append((begin, end))
+                    continue
+                logger.info(f"Backfill {begin} - {end}: сохранено дней {saved}")
+                if self.store.missing_dates(begin, end):
+                    self.incomplete.append((begin, end))
+                    continue
+                analyticscache.atomic_pickle_dump({"days": saved, "finished": time()}, self._checkpoint(begin, end))
+
+        if failed:
+            raise GoogleAnalyticsError(f"Не выполнены куски {failed}, повторный запуск продолжит с контрольной точки")
+        if self.incomplete:
+            logger.warning(f"Backfill: в кусках {self.incomplete} данные еще не golden, они будут догружены позже")
+        return self.load()
+
+    def load(self, begin: date = None, end: date = None) -> DateDeque:
+        """
+        Дни периода из кеша по дням
+        """
+        return DateDeque(self.store.load_range(begin or self.begin, end or self.end))
@@ -1,24 +1,28 @@
 from __future__ import annotations
 
 from datetime import date, timedelta
-from googleapiclient import discovery
-from oauth2client.service_account import ServiceAccountCredentials
+from typing import TYPE_CHECKING
 from common_constants import constants
 from google_analytics import analyticscache
+from google_analytics.analyticscache import get_envi
+from google_analytics.analyticsmetrics import METRICS
 from collections import deque
+from bisect import bisect_left, bisect_right, insort
 import pickle
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from copy import deepcopy
 
-from time import sleep
-from urllib3.exceptions import ProtocolError
-from http.client import RemoteDisconnected
-from googleapiclient.errors import HttpError
-from socket import timeout
+if TYPE_CHECKING:  # googleapiclient и oauth2client загружаются при первом обращении к API
+    from googleapiclient import discovery
+    from oauth2client.service_account import ServiceAccountCredentials
+
+
+def __getattr__(name: str):
+    if name == "ENVI":  # совместимость: analyticsbase.ENVI читается лениво
+        return get_envi()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
-ENVI = constants.EnviVar(
-    main_dir="/home/eugene/Yandex.Disk/localsource/google_analytics/",
-    cred_dir="/home/eugene/Yandex.Disk/localsource/credentials/"
-)
 logger = constants.logging.getLogger(__name__)
 
 
@@ -26,7 +30,55 @@ class GoogleAnalyticsError(constants.PySeaError): pass
 class LimitOfRetryError(GoogleAnalyticsError): pass
 
 
-def updatable_dump_to(prefix):
+# данные за последние дни могут еще обрабатываться (isDataGolden = False),
+# такие дни запрашиваются отдельным периодом, чтобы не портить golden-статус более ранних дней
+GOLDEN_LAG_DAYS = 2
+
+
+def _not_golden(report) -> bool:
+    """
+    True, если отчет явно помечен как не golden (так помечаются отчеты по дням из split_report_by_date).
+    Такие дни не сохраняются в кеш и считаются недостающими при следующем запуске.
+    """
+    data = report.get('data') if isinstance(report, dict) else getattr(report, 'data', None)
+    return isinstance(data, dict) and data.get('isDataGolden') is False
+
+
+def _golden_only_days(data):
+    # копия DateDeque без дней с не golden данными - для записи в кеш
+    if type(data) is not DateDeque or not any(_not_golden(i[1]) for i in data):
+        return data
+    return DateDeque((i for i in data if not _not_golden(i[1])), data.maxlen)
+
+
+def _load_updatable_dump(file_out: str):
+    """
+    Читает файл частичного кеша: первым лежит сериализованный объект (обычно DateDeque),
+    за ним могут следовать дописанные инкрементальным режимом порции новых дней (списки (date, report)).
+    Оборванная при сбое последняя порция отбрасывается, прочитанное до нее сохраняется.
+
+    :param file_out: путь к файлу кеша
+    :return: (данные, количество дописанных порций, False - если хвост файла поврежден и его нужно перезаписать)
+    """
+    frames = 0
+    with open(file_out, "rb") as file:
+        read_data = pickle.load(file)
+        while True:
+            try:
+                chunk = pickle.load(file)
+            except EOFError:
+                break
+            except Exception as err:
+                logger.warning(f"{err}\n Cache file {file_out} has a broken tail, ignoring it")
+                return read_data, frames, False
+            if type(read_data) is DateDeque:
+                for i in chunk:
+                    read_data.insert_by_date(i)
+            frames += 1
+    return read_data, frames, True
+
+
+def updatable_dump_to(prefix, incremental=False, compact_after=30):
     """
     Декоратор для частичного кеширования.
     Например, запрос данных из Google Analytics,
@@ -41,31 +93,103 @@ def updatable_dump_to(prefix):
 
     Кеш хранится в сериализованных файлах с помощью pickle
 
+    В инкрементальном режиме декорируемая функция возвращает DateDeque (обычно через fill_missing_dates),
+    а в файл дописываются только дни, которых не было в кеше, без перезаписи всего файла.
+    Когда дописанных порций становится больше compact_after или хвост файла поврежден,
+    файл перезаписывается целиком (атомарно).
+
     :param prefix: идентифицирует декорируемую кешируемую функцию
+    :param incremental: True - дописывать в кеш только новые дни
+    :param compact_after: количество дописанных порций, после которого файл уплотняется
     :return:
     """
     def deco_dump(f):  # собственно декоратор принимающий функцию для декорирования
         def constructed_function(self, *argp, **argn):  # конструируемая функция
             file_out = "{}/{}_{}_data.pickle".format(self.directory, self.dump_file_prefix, prefix).replace("//", "/")
-            read_data = None
+            read_data, frames, intact = None, 0, True
 
             if self.cache:  # если кеширование требуется
                 try:  # пробуем прочитать из файла
-                    with open(file_out, "rb") as file:
-                        read_data = pickle.load(file)
-                except Exception as msg:
+                    read_data, frames, intact = _load_updatable_dump(file_out)
+                except FileNotFoundError as msg:
                     print(msg)
-                    pass
+                except Exception as err:
+                    logger.warning(f"{err}\n Cache file {file_out} is broken, getting fresh...")
 
             self._set_cache_data(read_data)
-            read_data = f(self, *argp, **argn)
-            with open(file_out, "wb") as file:  # записываем результат в файл
-                pickle.dump(read_data, file, pickle.HIGHEST_PROTOCOL)
+            known_dates = set(read_data.dates()) if type(read_data) is DateDeque else None
+            with METRICS.timer("ga_updatable_dump_seconds", prefix=prefix):
+                read_data = f(self, *argp, **argn)
+
+            if incremental and known_dates is not None and type(read_data) is DateDeque \
+                    and frames < compact_after and intact:
+                new_days = [i for i in read_data if i[0] not in known_dates and not _not_golden(i[1])]
+                METRICS.incr("ga_dump_cache_days_total", len(known_dates), prefix=prefix, status="hit")
+                METRICS.incr("ga_dump_cache_days_total", len(new_days), prefix=prefix, status="miss")
+                if new_days:
+                    with open(file_out, "ab") as file:  # дописываем только новые дни
+                        pickle.dump(new_days, file, pickle.HIGHEST_PROTOCOL)
+                return read_data
+
+            # записываем результат в файл атомарно, дни с не golden данными не сохраняем
+            analyticscache.atomic_pickle_dump(_golden_only_days(read_data), file_out)
             return read_data
         return constructed_function
     return deco_dump
 
 
+def partitioned_dump_to(prefix):
+    """
+    Декоратор для кеширования по дням в DayPartitionStore.
+    Применим к методам, которые собирают данные через fill_missing_dates:
+    каждый полученный день сразу атомарно записывается в свой файл,
+    а из кеша загружаются только дни запрошенного периода.
+
+    Применим к методам класса, в котором объявлены:
+    self.directory - ссылка на каталог
+    self.dump_file_prefix - файловый префикс
+    self.cache - True - кеширование требуется / False
+
+    :param prefix: идентифицирует декорируемую кешируемую функцию
+    :return:
+    """
+    def deco_dump(f):  # собственно декоратор принимающий функцию для декорирования
+        def constructed_function(self, *argp, **argn):  # конструируемая функция
+            store_prefix, self.store_prefix = self.store_prefix, f"{self.dump_file_prefix}_{prefix}"
+            try:
+                return f(self, *argp, **argn)
+            finally:
+                self.store_prefix = store_prefix
+        return constructed_function
+    return deco_dump
+
+
+def _dump_path(directory: str, dump_file_prefix: str, prefix: str, day=None) -> str:
+    return "{}/{}_{}_{}.pickle".format(directory, dump_file_prefix, prefix, day or date.today()).replace("//", "/")
+
+
+def read_dump(directory: str, dump_file_prefix: str, prefix: str, day=None):
+    """
+    Чтение кеша dump_to без создания GoogleAnalyticsBase: не загружает googleapiclient/oauth2client
+    и не обращается к API, подходит для задач, которые только читают выгруженные данные.
+
+    :param directory: каталог кеша (self.directory)
+    :param dump_file_prefix: файловый префикс (self.dump_file_prefix)
+    :param prefix: префикс декорированной функции
+    :param day: дата в имени файла, по умолчанию сегодняшняя
+    :return: сохраненные данные или None, если кеша нет или он поврежден
+    """
+    file_out = _dump_path(directory, dump_file_prefix, prefix, day)
+    try:
+        with open(file_out, "rb") as file:
+            return pickle.load(file)
+    except FileNotFoundError as err:
+        logger.debug(f"{err}\n Cache file {file_out} is empty")
+    except Exception as err:
+        logger.warning(f"{err}\n Cache file {file_out} is broken")
+    return None
+
+
 def dump_to(prefix, d=False):  # конструктор декоратора (n залипает в замыкании)
     """
     Декоратор для кеширования возврата функции.
@@ -88,73 +212,44 @@ def dump_to(prefix, d=False):  # конструктор декоратора (n
             else:
                 dump_file_prefix = self.dump_file_prefix
 
-            if not d:
-                file_out = "{}/{}_{}_{}.pickle".format(self.directory, dump_file_prefix, prefix,
-                                                     date.today()).replace("//", "/")
-            else:
-                file_out = "{}/{}_{}_{}.pickle".format(self.directory, dump_file_prefix, prefix,
-                                                     self.current_date).replace("//", "/")
+            day = self.current_date if d else None
+            file_out = _dump_path(self.directory, dump_file_prefix, prefix, day)
             read_data = ""
 
-            if self.cache:  # если кеширование требуется
-                try:  # пробуем прочитать из файла
-                    with open(file_out, "rb") as file:
-                        read_data = pickle.load(file)
-                except Exception as err:
-                    logger.debug(f"{err}\n Cache file {file_out} is empty, getting fresh...")
+            if self.cache:  # если кеширование требуется, пробуем прочитать из файла
+                read_data = read_dump(self.directory, dump_file_prefix, prefix, day) or ""
 
+            METRICS.incr("ga_dump_cache_total", prefix=prefix, status="hit" if read_data else "miss")
             if not read_data:  # если не получилось то получаем данные прямым вызовом функции
                 read_data = f(self, *argp, **argn)
                 if 'dump_parts_flag' in self.__dict__:
                     self.dump_parts_flag['len'] = len(read_data)
 
-                with open(file_out, "wb") as file:  # записываем результат в файл
-                    if 'dump_parts_flag' in self.__dict__:
-                        pickle.dump(read_data[-self.dump_parts_flag['len']:], file, pickle.HIGHEST_PROTOCOL)
-                    else:
-                        pickle.dump(read_data, file, pickle.HIGHEST_PROTOCOL)
+                # записываем результат в файл атомарно
+                if 'dump_parts_flag' in self.__dict__:
+                    analyticscache.atomic_pickle_dump(read_data[-self.dump_parts_flag['len']:], file_out)
+                else:
+                    analyticscache.atomic_pickle_dump(read_data, file_out)
             return read_data
         return constructed_function
     return deco_dump
 
 
-def connection_attempts(n=12, t=10):  # конструктор декоратора (N,T залипает в замыкании)
+def connection_attempts(n=12, t=10, max_delay=300):  # конструктор декоратора (N,T залипает в замыкании)
     """
-    Декоратор задает n попыток для соединения с сервером в случае ряда исключений
-    с задержкой t*2^i секунд
-
-    :param n: количество попыток соединения с сервером [1, 15]
-    :param t: количество секунд задержки на первой попытке попытке (на i'ом шаге t*2^i)
+    Декоратор задает n повторов запроса к серверу при временных ошибках (соединение, таймауты, HTTP 429/5xx)
+    со случайной задержкой до t*2^i секунд, но не более max_delay (или по заголовку Retry-After).
+    Постоянные ошибки (например, HTTP 400/403) пробрасываются сразу.
+    Подробнее - analyticsretry.RetryPolicy
+
+    :param n: количество повторов запроса
+    :param t: базовая задержка в секундах (на i'ом шаге до t*2^i)
+    :param max_delay: предельная задержка в секундах
     :return:
     """
     def deco_connect(f):  # собственно декоратор принимающий функцию для декорирования
-        def constructed_function(*argp, **argn):  # конструируемая функция
-            retry_flag, pause_seconds = n, t
-            try_number = 0
-
-            if retry_flag < 0 or retry_flag > 15:
-                retry_flag = 8
-            if pause_seconds < 1 or pause_seconds > 30:
-                pause_seconds = 10
-
-            while True:
-                try:
-                    result = f(*argp, **argn)
-                    # Обработка ошибки, если не удалось соединиться с сервером
-                except (ConnectionError,
-                        ProtocolError, RemoteDisconnected,
-                        HttpError, timeout) as err:
-                    logger.error(f"Ошибка соединения с сервером {err}. Осталось попыток {retry_flag - try_number}")
-                    if try_number >= retry_flag:
-                        raise LimitOfRetryError
-                    sleep(pause_seconds * 2 ** try_number)
-                    try_number += 1
-                    continue
-                else:
-                    return result
-
-            return None
-        return constructed_function
+        from google_analytics.analyticsretry import RetryPolicy
+        return RetryPolicy(retries=n, base_delay=t, max_delay=max_delay)(f)
     return deco_connect
 
 
@@ -173,6 +268,76 @@ def handle_v3_errors(f):
     return constructed_function
 
 
+def _paginate(fetch, prefetch=False):
+    """
+    Генератор ответов batchGet постранично по nextPageToken первого отчета
+
+    :param fetch: функция token -> ответ batchGet (token None для первой страницы)
+    :param prefetch: запрашивать следующую страницу в фоновом потоке, пока обрабатывается текущая
+                     (в памяти не более двух страниц)
+    """
+    if not prefetch:
+        token = None
+        while True:
+            data = fetch(token)
+            METRICS.incr("ga_pages_total")
+            yield data
+            token = data['reports'][0].get('nextPageToken', False)
+            if not token:
+                return
+
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="ga-prefetch") as pool:
+        future = pool.submit(fetch, None)
+        while future is not None:
+            data = future.result()
+            METRICS.incr("ga_pages_total")
+            token = data['reports'][0].get('nextPageToken', False)
+            future = pool.submit(fetch, token) if token else None
+            yield data
+            data = None  # не держим страницу, пока ждем следующую
+
+
+def _join_pages(pages) -> dict:
+    """
+    Собирает страницы одного отчета (reports[0] ответов batchGet) в отчет со всеми строками
+    """
+    report = None
+    for page in pages:
+        if report is None:
+            report = page
+            report['data'].setdefault("rows", [])
+        else:
+            report['data']['rows'].extend(page['data'].get("rows", []))
+    report.pop('nextPageToken', None)
+    return report
+
+
+def _decorated_pages(self, f, argp, argn, page_size, prefetch):
+    # страницы метода, который строит запрос по self.pageToken и self.pageSize
+    def fetch(token):
+        if token is not None:
+            self.pageToken = token
+        return f(self, *argp, **argn)
+
+    self.pageSize = abs(page_size) if abs(page_size) <= 10000 else 10000
+    try:
+        yield from _paginate(fetch, prefetch)
+    finally:
+        self.pageToken = 0  # не забываем вернуть пагенатор в исходное состояние для следующих вызовов
+
+
+def _compact_pages(pages):
+    # собирает страницы первого отчета в CompactReport, не накапливая словари строк
+    from google_analytics.analyticsrows import CompactReport
+    result = None
+    for data in pages:
+        report = data['reports'][0]
+        if result is None:
+            result = CompactReport(report.get('columnHeader', {}), report.get('data', {}))
+        result.extend(report['data'].get("rows", []))
+    return result
+
+
 def limit_by(page_size=1000, rows_or_full="rows"):  # конструктор декоратора (L залипает в замыкании)
     """
     Декоратор для использования постраничной выборки
@@ -180,47 +345,336 @@ def limit_by(page_size=1000, rows_or_full="rows"):  # конструктор д
     Декоратор применим, только для запросов с одним отчетом (reportRequests)
 
     :param page_size: не более 10 000 объектов за один запрос.
+    :param rows_or_full: "rows" - список строк, "compact" - analyticsrows.CompactReport, иначе - список ответов
     :return: возвращает только данные массива rows
     """
     def deco_limit(f):  # собственно декоратор принимающий функцию для декорирования
         def constructed_function(self, *argp, **argn):  # конструируемая функция
+            if rows_or_full == "compact":
+                return _compact_pages(_decorated_pages(self, f, argp, argn, page_size, False))
             result = []
-
-            self.pageSize = abs(page_size) if abs(page_size) <= 10000 else 10000
-
-            data = f(self, *argp, **argn)
-            if rows_or_full == "rows":
-                result.extend(data['reports'][0]['data'].get("rows", []))
-            else:
-                result.append(data)
-
-            while data['reports'][0].get('nextPageToken', False):
-                self.pageToken = data['reports'][0]['nextPageToken']
-                data = f(self, *argp, **argn)
+            for data in _decorated_pages(self, f, argp, argn, page_size, False):
                 if rows_or_full == "rows":
                     result.extend(data['reports'][0]['data'].get("rows", []))
                 else:
                     result.append(data)
-
-            self.pageToken = 0  # не забываем вернуть пагенатор в исходное состояние для следующих вызовов
             return result
         return constructed_function
     return deco_limit
 
 
+def stream_by(page_size=1000, rows_or_full="rows", prefetch=False):  # конструктор декоратора
+    """
+    Потоковый вариант limit_by: декорированный метод становится генератором,
+    который отдает строки (или целые ответы) по мере получения страниц, не накапливая весь отчет в памяти.
+    Декоратор применим, только для запросов с одним отчетом (reportRequests)
+
+    :param page_size: не более 10 000 объектов за один запрос.
+    :param rows_or_full: "rows" - отдавать строки отчета, иначе - ответы batchGet постранично
+    :param prefetch: запрашивать следующую страницу, пока вызывающий код обрабатывает текущую
+    :return: генератор строк или ответов
+    """
+    def deco_stream(f):  # собственно декоратор принимающий функцию для декорирования
+        def constructed_function(self, *argp, **argn):  # конструируемая функция-генератор
+            for data in _decorated_pages(self, f, argp, argn, page_size, prefetch):
+                if rows_or_full == "rows":
+                    yield from data['reports'][0]['data'].get("rows", [])
+                else:
+                    yield data
+        return constructed_function
+    return deco_stream
+
+
+def spill_to(prefix, page_size=1000):  # конструктор декоратора
+    """
+    Вариант limit_by со сбросом страниц на диск: каждая полученная страница сразу дописывается
+    в {self.directory}/{self.dump_file_prefix}_{prefix}_{date.today()}.spill/rows.jsonl вместе с nextPageToken,
+    поэтому память не растет с размером отчета, а прерванная выгрузка продолжается с последней записанной страницы.
+    Если выгрузка за сегодня уже завершена и self.cache включен, строки берутся с диска без запросов.
+    Каталоги выгрузок прошлых дней удаляются.
+    Декоратор применим, только для запросов с одним отчетом (reportRequests)
+
+    :param prefix: идентифицирует декорируемую функцию
+    :param page_size: не более 10 000 объектов за один запрос.
+    :return: analyticsspill.SpilledRows - ленивый итератор строк с длиной (в дамп dump_to попадает списком строк)
+    """
+    def deco_spill(f):  # собственно декоратор принимающий функцию для декорирования
+        def constructed_function(self, *argp, **argn):  # конструируемая функция
+            from google_analytics.analyticsspill import SpillFile, remove_spills
+
+            base = "{}/{}_{}_".format(self.directory, self.dump_file_prefix, prefix).replace("//", "/")
+            spill = SpillFile(f"{base}{date.today()}.spill")
+            remove_spills(base, spill.path)
+            state = spill.resume()
+            if state["done"]:
+                if self.cache:
+                    return spill.rows()
+                spill.reset()
+            elif state["token"]:
+                self.pageToken = state["token"]
+
+            for data in _decorated_pages(self, f, argp, argn, page_size, False):
+                report = data['reports'][0]
+                spill.append_page(report['data'].get("rows", []), report.get('nextPageToken'))
+            return spill.rows()
+        return constructed_function
+    return deco_spill
+
+
+def date_spans(dates) -> list:
+    """
+    Группирует даты в непрерывные периоды
+
+    :param dates: даты по возрастанию
+    :return: список кортежей (начало, конец) включительно
+    """
+    spans = []
+    for d in dates:
+        if spans and spans[-1][1] + timedelta(1) == d:
+            spans[-1][1] = d
+        else:
+            spans.append([d, d])
+    return [tuple(i) for i in spans]
+
+
 class DateDeque(deque):
-    def __contains__(self, item):
+    """
+    Дека отчетов по дням: элементы - кортежи (date, report).
+
+    Помимо самой деки поддерживается индекс дата -> элемент (проверка наличия даты и get_by_date за O(1))
+    и отсортированный список уникальных дат (выборка периода и поиск пропусков за O(log n)).
+    Если дата встречается несколько раз, индекс указывает на первый по порядку элемент, как и прежде.
+
+    Сериализуется как обычная дека, поэтому старые дампы DateDeque загружаются без изменений,
+    а индекс перестраивается при загрузке.
+    """
+    def __init__(self, iterable=(), maxlen=None):
+        super().__init__((), maxlen)
+        self._index = {}  # дата -> первый элемент с этой датой
+        self._counts = {}  # дата -> количество элементов с этой датой
+        self._dates = []  # отсортированные уникальные даты
+        self._ordered = True  # True - дека упорядочена по датам, None - неизвестно
+        self.extend(iterable)
+
+    def __reduce__(self):
+        # индекс не сериализуем: он перестраивается через extend при загрузке
+        return type(self), ((), self.maxlen), None, iter(self)
+
+    def __copy__(self):
+        return type(self)(self, self.maxlen)
+
+    # --- поддержка индекса ---
+    def _remember(self, item, first=False):
+        d = item[0]
+        count = self._counts.get(d, 0)
+        if not count:
+            insort(self._dates, d)
+            self._index[d] = item
+        elif first:
+            self._index[d] = item
+        self._counts[d] = count + 1
+
+    def _forget(self, item):
+        d = item[0]
+        count = self._counts[d] - 1
+        if not count:
+            del self._counts[d]
+            del self._index[d]
+            del self._dates[bisect_left(self._dates, d)]
+            return
+        self._counts[d] = count
+        if self._index[d] is item:  # удалили первый из дубликатов - ищем следующий
+            self._index[d] = next(i for i in self if i[0] == d)
+
+    def _rebuild(self):
+        self._index, self._counts, self._dates = {}, {}, []
         for i in self:
-            if i[0] == item:
-                return True
-        else:
-            return False
+            self._remember(i)
+        self._ordered = None
+
+    def _reordered(self):
+        # порядок изменился: при дублях дат меняется и первый элемент каждой даты
+        if len(self) != len(self._dates):
+            self._rebuild()
+        self._ordered = None
+
+    def _check_full(self, left):
+        # при заданном maxlen дека молча вытесняет элемент с противоположного конца;
+        # удаляем его сами до вставки, чтобы индекс не нашел вытесняемый элемент среди оставшихся
+        if self.maxlen is not None and len(self) == self.maxlen and len(self):
+            if left:
+                self.pop()
+            else:
+                self.popleft()
+
+    # --- изменяющие методы deque ---
+    def append(self, item):
+        if self.maxlen == 0:
+            return
+        self._check_full(left=False)
+        if self._ordered and len(self) and item[0] < self[-1][0]:
+            self._ordered = False
+        super().append(item)
+        self._remember(item)
+
+    def appendleft(self, item):
+        if self.maxlen == 0:
+            return
+        self._check_full(left=True)
+        if self._ordered and len(self) and item[0] > self[0][0]:
+            self._ordered = False
+        super().appendleft(item)
+        self._remember(item, first=True)
+
+    def extend(self, iterable):
+        for i in iterable:
+            self.append(i)
+
+    def extendleft(self, iterable):
+        for i in iterable:
+            self.appendleft(i)
+
+    def __iadd__(self, other):
+        self.extend(other)
+        return self
+
+    def __imul__(self, n):
+        super().__imul__(n)
+        self._rebuild()
+        return self
+
+    def __add__(self, other):
+        # deque.__add__ дополняет копию на уровне C, минуя extend и индекс
+        if not isinstance(other, deque):
+            return NotImplemented
+        result = self.__copy__()
+        result.extend(other)
+        return result
+
+    def __mul__(self, n):
+        result = self.__copy__()
+        result *= n
+        return result
+
+    __rmul__ = __mul__
+
+    def pop(self):
+        item = super().pop()
+        self._forget(item)
+        return item
+
+    def popleft(self):
+        item = super().popleft()
+        self._forget(item)
+        return item
+
+    def remove(self, value):
+        super().remove(value)
+        self._rebuild()
+
+    def insert(self, i, item):
+        super().insert(i, item)
+        self._rebuild()
+
+    def __setitem__(self, i, item):
+        super().__setitem__(i, item)
+        self._rebuild()
+
+    def __delitem__(self, i):
+        super().__delitem__(i)
+        self._rebuild()
+
+    def rotate(self, n=1):
+        super().rotate(n)
+        self._reordered()
+
+    def reverse(self):
+        super().reverse()
+        self._reordered()
+
+    def clear(self):
+        super().clear()
+        self._index, self._counts, self._dates = {}, {}, []
+        self._ordered = True
+
+    # --- поиск по датам ---
+    def __contains__(self, item):
+        return item in self._index
 
     def get_by_date(self, item):
-        for i in self:
-            if i[0] == item:
-                return i
-        return None
+        return self._index.get(item)
+
+    def dates(self) -> list:
+        """
+        Отсортированный список уникальных дат в деке
+        """
+        return list(self._dates)
+
+    def range(self, begin: date, end: date) -> list:
+        """
+        Элементы за период [begin, end] в порядке возрастания дат (для дублей - первый элемент)
+
+        :param begin: начальная дата периода
+        :param end: конечная дата периода (включительно)
+        :return: список кортежей (date, report)
+        """
+        lo, hi = bisect_left(self._dates, begin), bisect_right(self._dates, end)
+        return [self._index[d] for d in self._dates[lo:hi]]
+
+    def missing_dates(self, begin: date, end: date) -> list:
+        """
+        Даты периода [begin, end], для которых в деке нет отчета
+
+        :param begin: начальная дата периода
+        :param end: конечная дата периода (включительно)
+        :return: список дат по возрастанию
+        """
+        result = []
+        day, pos = begin, bisect_left(self._dates, begin)
+        while day <= end:
+            if pos < len(self._dates) and self._dates[pos] == day:
+                pos += 1
+            else:
+                result.append(day)
+            day += timedelta(1)
+        return result
+
+    def insert_by_date(self, item) -> None:
+        """
+        Упорядоченная вставка отчета: если дата уже есть в деке, отчет за нее заменяется,
+        иначе элемент встает на свое место по дате. Для упорядоченной деки без дублей это
+        бинарный поиск и одна вставка, иначе дека предварительно сортируется.
+        Если дека заполнена (maxlen), вытесняется самый старый день; отчет старше всех дней заполненной деки
+        не вставляется.
+
+        :param item: кортеж (date, report)
+        """
+        d = item[0]
+        self.sort_by_date()
+        if self.maxlen is not None and len(self) == self.maxlen and (not len(self) or d < self[0][0]):
+            return
+        if len(self) != len(self._dates):  # в деке есть дубли дат - позиция ищется линейно
+            if d in self._index:
+                pos = next(n for n, i in enumerate(self) if i[0] == d)
+                super().__setitem__(pos, item)
+                self._index[d] = item
+            else:
+                self.append(item)
+                self.sort_by_date()
+            return
+        if not len(self) or d > self[-1][0]:
+            self.append(item)
+            return
+        pos = bisect_left(self._dates, d)
+        if d in self._index:
+            super().__setitem__(pos, item)
+            self._index[d] = item
+        else:
+            if self.maxlen is not None and len(self) == self.maxlen:
+                self.popleft()
+                pos -= 1
+            super().insert(max(pos, 0), item)
+            self._remember(item)
 
     def sort_by_date(self):
         """
@@ -228,9 +682,14 @@ class DateDeque(deque):
         но если вдруг нет уверенности, то можно воспользоваться этим методом для сортировки
         :return:
         """
+        if self._ordered is None:
+            self._ordered = all(self[i - 1][0] <= self[i][0] for i in range(1, len(self)))
+        if self._ordered:
+            return
         items = sorted(self, key=lambda x: x[0], reverse=False)
-        self.clear()
-        self.extend(items)
+        super().clear()
+        super().extend(items)
+        self._ordered = True
 
     def clear_dates_before(self, d):
         # чистим устаревшие даны из кэша
@@ -246,12 +705,15 @@ class GoogleAnalyticsBase:
     https://developers.google.com/analytics/devguides/reporting/core/v4/basics#segments
     https://developers.google.com/analytics/devguides/reporting/core/v4/rest/v4/reports/batchGet
     """
+    # профили представлений для iter_fan_out/fan_out: имя -> переменная окружения с id представления
+    VIEW_PROFILES = {"site": 'PYSEA_ANALYTICS_VIEW_ID', "app": 'PYSEA_ANALYTICS_MOBILEVIEW_ID'}
+
     def __init__(self, directory: str = "./",
                  dump_file_prefix: str = "fooooo",
                  cache: bool = True) -> None:
 
         self.scopes = ['https://www.googleapis.com/auth/analytics.readonly']
-        self.view_id = ENVI['PYSEA_ANALYTICS_VIEW_ID']
+        self.view_id = get_envi()['PYSEA_ANALYTICS_VIEW_ID']
         self.analytics = None
         self.date_ranges = [{'startDate': 'yesterday', 'endDate': 'yesterday'}]
         self.begin_date = date.today() - timedelta(1)
@@ -265,6 +727,12 @@ class GoogleAnalyticsBase:
         # https://developers.google.com/analytics/devguides/reporting/core/v4/resource-based-quota
         self.use_resource_quotas = False
 
+        # кеш ответов batchGet по содержимому запроса (см. result_cache_enable)
+        self.result_cache = None
+
+        # планировщик запросов по квотам API (см. quota_manager_enable)
+        self.quota = None
+
         # переменные устанавливают постраничные запросы к API
         self.pageSize = 25
         self.pageToken = 0
@@ -272,6 +740,10 @@ class GoogleAnalyticsBase:
 
         # дека для хранения отчетов по дням
         self.data = DateDeque()
+        # префикс кеша по дням (устанавливается декоратором partitioned_dump_to)
+        self.store_prefix = None
+        # хранить отчеты по дням в self.data как analyticsrows.CompactReport
+        self.compact_reports = False
 
         # множество целей и конверсий
         self.collect_only_golden_data = False
@@ -280,32 +752,37 @@ class GoogleAnalyticsBase:
         self.golden_begin_date = self.begin_date
         self.golden_end_date = self.begin_date
 
+    def _keyfile(self) -> str:
+        return f'{get_envi()["CREDENTIALS_DIR"]}EK-GA-project-2599388e697a.json'
+
+    def _credentials_key(self) -> tuple:
+        return self._keyfile(), tuple(self.scopes)
+
+    def _get_credentials(self) -> ServiceAccountCredentials:
+        from oauth2client.service_account import ServiceAccountCredentials
+        return ServiceAccountCredentials.from_json_keyfile_name(self._keyfile(), self.scopes)
+
     def _initialize_analytics_service(self, version: str = "v4") -> discovery.Resource:
         """
         Initializes an Analytics Reporting API V4 service object.
         Returns: An authorized Analytics Reporting API V4 service object.
+
+        Учетные данные и клиент берутся из общей фабрики процесса (analyticsservice.FACTORY),
+        клиент собственный для каждого потока.
         """
-        credentials = ServiceAccountCredentials.from_json_keyfile_name(
-            f'{ENVI["CREDENTIALS_DIR"]}EK-GA-project-2599388e697a.json', self.scopes)
+        from google_analytics.analyticsservice import FACTORY
 
-        # Build the service object.
         if version == "v3":
-            analytics_service = discovery.build("analytics", "v3", credentials=credentials,
-                                                cache=analyticscache.DumpFileDiscoveryCache())
-        elif version == "v4":
-            analytics_service = discovery.build('analyticsreporting', 'v4', credentials=credentials,
-                                                cache=analyticscache.DumpFileDiscoveryCache())
+            api, api_version = "analytics", "v3"
         else:
-            analytics_service = discovery.build('analyticsreporting', 'v4', credentials=credentials,
-                                                cache=analyticscache.DumpFileDiscoveryCache())
-
-        return analytics_service
+            api, api_version = "analyticsreporting", "v4"
+        return FACTORY.service(self._credentials_key(), self._get_credentials, api, api_version)
 
     def use_app_view_id(self) -> None:
-        self.view_id = ENVI['PYSEA_ANALYTICS_MOBILEVIEW_ID']
+        self.view_id = get_envi()['PYSEA_ANALYTICS_MOBILEVIEW_ID']
 
     def use_site_view_id(self) -> None:
-        self.view_id = ENVI['PYSEA_ANALYTICS_VIEW_ID']
+        self.view_id = get_envi()['PYSEA_ANALYTICS_VIEW_ID']
 
     def tune_for_site_view_id(self) -> None:
         # функция для переопределения
@@ -332,6 +809,39 @@ class GoogleAnalyticsBase:
         self.use_resource_quotas = False
         return self
 
+    def result_cache_enable(self, directory: str = None, ttl: float = 3600,
+                            max_bytes: int = 512 * 2 ** 20) -> GoogleAnalyticsBase:
+        """
+        Включает кеш ответов batchGet по содержимому запроса, общий для всех процессов хоста
+
+        :param directory: каталог кеша, по умолчанию alldata/cache/reports/
+        :param ttl: срок хранения не golden ответов, секунд
+        :param max_bytes: предельный размер кеша
+        """
+        self.result_cache = analyticscache.ReportCache(directory, ttl, max_bytes)
+        return self
+
+    def result_cache_disable(self) -> GoogleAnalyticsBase:
+        self.result_cache = None
+        return self
+
+    def quota_manager_enable(self, ledger_path: str = None, **limits) -> GoogleAnalyticsBase:
+        """
+        Включает учет квот в общем для процессов журнале и ограничение частоты перед каждым запросом
+        (см. analyticsquota.QuotaManager). useResourceQuotas (только Analytics 360) включается отдельно:
+        resource_quotas_enable.
+
+        :param ledger_path: файл SQLite журнала, по умолчанию alldata/cache/quota_ledger.sqlite
+        :param limits: параметры QuotaManager (project, qps, project_daily_requests, reserve, ...)
+        """
+        from google_analytics.analyticsquota import QuotaLedger, QuotaManager
+        self.quota = QuotaManager(QuotaLedger(ledger_path), **limits)
+        return self
+
+    def quota_manager_disable(self) -> GoogleAnalyticsBase:
+        self.quota = None
+        return self
+
     def set_data_range(self, begin: str, end: str = "") -> None:
         """
         Устанавливает период для запроса отчета Google Analytics
@@ -353,6 +863,158 @@ class GoogleAnalyticsBase:
             self.data = cache_data
         return self
 
+    def missing_dates(self) -> list:
+        """
+        Дни периода begin_date..end_date, которых нет в self.data или данные за которые еще не golden
+        """
+        missing = set(self.data.missing_dates(self.begin_date, self.end_date))
+        missing.update(day for day, report in self.data.range(self.begin_date, self.end_date) if _not_golden(report))
+        return sorted(missing)
+
+    @staticmethod
+    def _golden_spans(spans: list) -> list:
+        # отделяет от периодов последние GOLDEN_LAG_DAYS дней, данные за которые могут быть еще не golden
+        settled = date.today() - timedelta(GOLDEN_LAG_DAYS)
+        result = []
+        for begin, end in spans:
+            if begin <= settled < end:
+                result += [(begin, settled), (settled + timedelta(1), end)]
+            else:
+                result.append((begin, end))
+        return result
+
+    @staticmethod
+    def _requests_for_span(requests, begin: date, end: date) -> dict:
+        if callable(requests):
+            body = requests(begin, end)
+        else:  # шаблон запроса: подставляем период во все отчеты
+            body = deepcopy(requests)
+            for i in body["reportRequests"]:
+                i["dateRanges"] = [{'startDate': begin.isoformat(), 'endDate': end.isoformat()}]
+        for i in body["reportRequests"]:
+            i.setdefault("pageSize", 10000)  # меньше страниц - меньше запросов к API
+        return body
+
+    def iter_pages(self, requests: dict, golden_only: bool = False, prefetch: bool = False):
+        """
+        Генератор страниц первого отчета запроса (по nextPageToken).
+        Тело запроса копируется, self.pageToken не используется.
+
+        :param requests: тело запроса batchGet
+        :param golden_only: см. batch_get_requests
+        :param prefetch: запрашивать следующую страницу, пока обрабатывается текущая
+        :return: генератор отчетов (reports[0]) постранично
+        """
+        requests = deepcopy(requests)
+
+        def fetch(token):
+            if token is not None:
+                requests["reportRequests"][0]["pageToken"] = token
+            return self.batch_get_requests(requests, golden_only)
+
+        for data in _paginate(fetch, prefetch):
+            yield data['reports'][0]
+
+    def iter_rows(self, requests: dict, golden_only: bool = False, prefetch: bool = False):
+        """
+        Генератор строк первого отчета запроса по всем страницам, в памяти не больше пары страниц
+        """
+        for report in self.iter_pages(requests, golden_only, prefetch):
+            yield from report['data'].get("rows", [])
+
+    def fetch_columns(self, requests: dict, golden_only: bool = False, prefetch: bool = False):
+        """
+        Выгружает первый отчет запроса постранично сразу в столбцовый вид
+
+        :return: analyticscolumns.ColumnarReport
+        """
+        from google_analytics.analyticscolumns import decode_report
+        return decode_report(self.iter_pages(requests, golden_only, prefetch))
+
+    def _fetch_all_pages(self, requests: dict, golden_only: bool = False) -> dict:
+        # постранично выбирает первый отчет запроса и возвращает его со всеми строками
+        return _join_pages(self.iter_pages(requests, golden_only))
+
+    @staticmethod
+    def split_report_by_date(report: dict, begin: date, end: date) -> list:
+        """
+        Делит отчет с измерением ga:date на отчеты по дням периода [begin, end].
+        Дни без строк тоже попадают в результат - с пустым списком rows.
+
+        :return: список кортежей (date, report) по возрастанию дат
+        """
+        dimensions = report.get('columnHeader', {}).get('dimensions', [])
+        if 'ga:date' not in dimensions:
+            raise GoogleAnalyticsError("Для разбиения отчета по дням в запросе нужно измерение ga:date")
+        pos = dimensions.index('ga:date')
+        golden = report['data'].get('isDataGolden', False)
+
+        days = {}
+        for row in report['data'].get('rows', []):
+            days.setdefault(row['dimensions'][pos], []).append(row)
+
+        result, day = [], begin
+        while day <= end:
+            rows = days.get(day.strftime("%Y%m%d"), [])
+            result.append((day, {
+                'columnHeader': report.get('columnHeader', {}),
+                'data': {'rows': rows, 'rowCount': len(rows), 'isDataGolden': golden},
+            }))
+            day += timedelta(1)
+        return result
+
+    def fill_missing_dates(self, requests, golden_only: bool = None) -> DateDeque:
+        """
+        Инкрементальная догрузка: запрашивает из API только дни периода begin_date..end_date,
+        которых нет в self.data, объединяя их в непрерывные периоды (один запрос на период),
+        и вставляет полученные отчеты по дням в self.data.
+
+        Первый отчет запроса должен содержать измерение ga:date.
+        Последние GOLDEN_LAG_DAYS дней запрашиваются отдельным периодом. Если данные периода не golden,
+        его дни не сохраняются в кеш и будут запрошены снова, а с golden_only не попадают и в self.data.
+
+        :param requests: тело запроса batchGet (dateRanges подставляются для каждого периода)
+                         или функция (begin, end) -> тело запроса
+        :param golden_only: по умолчанию self.collect_only_golden_data
+        :return: self.data
+        """
+        if golden_only is None:
+            golden_only = self.collect_only_golden_data
+
+        store = self._day_store(requests)
+        if store is not None:  # подгружаем из кеша по дням только дни периода
+            loaded = 0
+            for i in store.load_range(self.begin_date, self.end_date, exclude=self.data):
+                self.data.insert_by_date(i)
+                loaded += 1
+            METRICS.incr("ga_partition_days_total", loaded, prefix=self.store_prefix, status="hit")
+
+        for begin, end in self._golden_spans(date_spans(self.missing_dates())):
+            logger.info(f"Запрашиваем недостающий период {begin} - {end}")
+            report = self._fetch_all_pages(self._requests_for_span(requests, begin, end), golden_only)
+            golden = report['data'].get('isDataGolden', False)
+            if golden_only and not golden:
+                continue
+            days = self.split_report_by_date(report, begin, end)
+            if self.compact_reports:
+                from google_analytics.analyticsrows import CompactReport
+                days = [(day, CompactReport.from_api(i)) for day, i in days]
+            for i in days:
+                self.data.insert_by_date(i)
+            if store is not None and golden:
+                store.save_many(days)
+                METRICS.incr("ga_partition_days_total", len(days), prefix=self.store_prefix, status="miss")
+        return self.data
+
+    def _day_store(self, requests):
+        # кеш по дням для запроса, если метод обернут partitioned_dump_to и кеширование включено
+        if not self.cache or not self.store_prefix:
+            return None
+        from google_analytics.analyticsstore import DayPartitionStore
+        report_request = self._requests_for_span(requests, self.begin_date, self.end_date)["reportRequests"][0]
+        return DayPartitionStore(self.directory, self.store_prefix, report_request.get('viewId', self.view_id),
+                                 analyticscache.query_fingerprint(report_request))
+
     @staticmethod
     def print_response(response: dict):
         """
@@ -378,17 +1040,68 @@ class GoogleAnalyticsBase:
                     for metric_header, value in zip(metric_headers, values.get('values')):
                         print(metric_header.get('name') + ': ' + value)
 
-    def batch_get_requests(self, requests: dict, golden_only: bool = False) -> dict:
-        if self.analytics is None:
-            self.analytics = self._initialize_analytics_service("v4")
-        result = self.analytics.reports().batchGet(body=requests).execute()
+    def batch_get_requests(self, requests: dict, golden_only: bool = False,
+                           analytics: discovery.Resource = None) -> dict:
+        """
+        :param requests: тело запроса batchGet
+        :param golden_only: убрать строки из отчетов, данные которых не golden
+        :param analytics: клиент API; по умолчанию self.analytics
+                          (в потоках передается свой клиент на поток, httplib2 не потокобезопасен)
+        """
+        if self.use_resource_quotas and "useResourceQuotas" not in requests:
+            requests = dict(requests, useResourceQuotas=True)  # тело вызывающего не меняем
+        labels = self._metric_labels(requests) if METRICS.enabled else {}
+
+        if self.result_cache is not None:
+            result = self.result_cache.get(requests)
+            METRICS.incr("ga_result_cache_total", status="hit" if result is not None else "miss", **labels)
+            if result is not None:
+                logger.debug("Ответ взят из кеша по содержимому запроса")
+                return self._check_response(requests, result, golden_only)
+
+        if analytics is None:
+            if self.analytics is None:
+                self.analytics = self._initialize_analytics_service("v4")
+            analytics = self.analytics
+
+        view_ids = {i.get('viewId', self.view_id) for i in requests["reportRequests"]}
+        if self.quota is not None:
+            self.quota.before_request(view_ids)
+        request = analytics.reports().batchGet(body=requests)
+        if METRICS.enabled and hasattr(request, "postproc"):
+            postproc = request.postproc
+
+            def counting_postproc(resp, content):
+                METRICS.incr("ga_response_bytes_total", len(content), **labels)
+                return postproc(resp, content)
+            request.postproc = counting_postproc
+        with METRICS.timer("ga_batch_get_seconds", **labels):
+            result = request.execute()
+        if METRICS.enabled:
+            METRICS.incr("ga_batch_get_total", **labels)
+            METRICS.incr("ga_rows_total", sum(len(i['data'].get('rows', [])) for i in result['reports']), **labels)
+        if self.quota is not None:
+            self.quota.after_response(view_ids, result)
+        if self.result_cache is not None:
+            self.result_cache.set(requests, result)  # до _check_response, который может убрать строки
+        return self._check_response(requests, result, golden_only)
+
+    def _metric_labels(self, requests: dict) -> dict:
+        # метки замеров: задача (файловый префикс), представление и отпечаток первого отчета запроса
+        report_request = requests["reportRequests"][0]
+        return {"job": self.dump_file_prefix, "view": report_request.get('viewId', self.view_id),
+                "query": analyticscache.query_fingerprint(report_request)}
 
-        logger.info(f"Quotas after request {result['resourceQuotasRemaining']}")
+    @staticmethod
+    def _check_response(requests: dict, result: dict, golden_only: bool = False) -> dict:
+        # журналирует квоты, выборку и golden-статус ответа batchGet, при golden_only убирает не golden строки
+        logger.info(f"Quotas after request {result.get('resourceQuotasRemaining')}")
         for num, i in enumerate(result['reports']):
             read_counts = i['data'].get('samplesReadCounts', False)
             space_sizes = i['data'].get('samplingSpaceSizes', False)
             data_golden = i['data'].get('isDataGolden', False)
             if read_counts:
+                METRICS.observe("ga_sampling_ratio", int(read_counts[0]) / int(space_sizes[0]))
                 for j in range(len(read_counts)-1):
                     logger.warning(f"SAMPLING: Google Analytics\n "
                                    f"ответ с выборкой {read_counts[j]}/{space_sizes[j]} "
@@ -397,7 +1110,7 @@ class GoogleAnalyticsBase:
                 logger.warning("NOT GOLDEN: точно такой же запрос, сделанный позже, может вернуть новый результат")
                 if golden_only:
                     logger.warning(f"Данная точка не будет учтена т.к. golden_only = {golden_only}")
-                    result['reports'][num]['data'].pop("rows")
+                    result['reports'][num]['data'].pop("rows", None)
 
             sampling_levels = {i.get('samplingLevel', False) for i in requests["reportRequests"]}
             if len(sampling_levels) > 1 or sampling_levels.pop() is not False:
@@ -405,12 +1118,103 @@ class GoogleAnalyticsBase:
 
         return result
 
+    def batch_get_many(self, requests_list: list, golden_only: bool = False, **executor_args) -> list:
+        """
+        Параллельно выполняет независимые запросы batchGet (по представлениям, периодам, сегментам и т.п.)
+        через BatchGetExecutor
+
+        :param requests_list: список тел запросов batchGet
+        :param golden_only: см. batch_get_requests
+        :param executor_args: параметры BatchGetExecutor (max_workers, max_concurrent, qps, ...)
+        :return: ответы в порядке запросов
+        """
+        from google_analytics.analyticsexecutor import BatchGetExecutor
+        with BatchGetExecutor(self, **executor_args) as executor:
+            return executor.map(requests_list, golden_only)
+
+    def batch_get_coalesced(self, report_requests: list, golden_only: bool = False, executor=None) -> list:
+        """
+        Выполняет независимые запросы отчетов, упаковывая совместимые по 5 в один batchGet
+        (см. analyticsbatch.ReportBatcher)
+
+        :param report_requests: элементы reportRequests
+        :return: отчеты со строками всех страниц в порядке запросов
+        """
+        from google_analytics.analyticsbatch import ReportBatcher
+        return ReportBatcher(self, golden_only, executor=executor).fetch(report_requests)
+
+    def run_specs(self, specs: list, golden_only: bool = False, executor=None) -> list:
+        """
+        Выполняет логические описания отчетов минимальным числом запросов: показатели и периоды
+        совместимых отчетов объединяются, итоги и фильтры считаются на стороне API
+        (см. analyticsplanner.QueryPlanner)
+
+        :param specs: список analyticsplanner.ReportSpec
+        :return: отчеты в формате API в порядке specs
+        """
+        from google_analytics.analyticsplanner import QueryPlanner
+        return QueryPlanner(self, golden_only, executor).run(specs)
+
+    @classmethod
+    def _requests_for_view(cls, requests, view) -> dict:
+        view_id = get_envi()[cls.VIEW_PROFILES[view]] if view in cls.VIEW_PROFILES else view
+        if callable(requests):
+            return requests(view_id)
+        body = deepcopy(requests)  # у каждого представления свое тело запроса и своя пагинация
+        for i in body["reportRequests"]:
+            i["viewId"] = view_id
+            i.pop("pageToken", None)
+        return body
+
+    def iter_fan_out(self, views: list, requests, golden_only: bool = False, **executor_args):
+        """
+        Выгружает один и тот же отчет по нескольким представлениям параллельно.
+        Состояние (тело запроса, pageToken) у каждого представления свое, self.view_id не меняется.
+
+        :param views: id представлений или профили "site" / "app"
+        :param requests: шаблон тела batchGet (viewId подставляется) или функция view_id -> тело запроса
+        :param golden_only: см. batch_get_requests
+        :param executor_args: параметры BatchGetExecutor (max_workers, qps, ...)
+        :return: генератор (представление, отчет со всеми строками) в порядке готовности;
+                 если перестать читать его раньше, еще не начатые выгрузки отменяются
+        """
+        from google_analytics.analyticsexecutor import BatchGetExecutor
+        with BatchGetExecutor(self, **executor_args) as executor:
+            futures = {executor.submit_report(self._requests_for_view(requests, i), golden_only): i for i in views}
+            try:
+                for future in as_completed(futures):
+                    yield futures[future], future.result()
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    def fan_out(self, views: list, requests, golden_only: bool = False, **executor_args) -> dict:
+        """
+        То же, что iter_fan_out, но дожидается всех представлений
+
+        :return: {представление: отчет}
+        """
+        return dict(self.iter_fan_out(views, requests, golden_only, **executor_args))
+
+    def batch_get_unsampled(self, requests: dict, golden_only: bool = False, **executor_args) -> dict:
+        """
+        Запрос без выборки: период с выборкой делится пополам и догружается параллельно
+        (см. BatchGetExecutor.fetch_unsampled)
+
+        :param requests: тело batchGet с одним отчетом и одним периодом в абсолютных датах
+        :param executor_args: параметры BatchGetExecutor
+        :return: ответ в формате batchGet
+        """
+        from google_analytics.analyticsexecutor import BatchGetExecutor
+        with BatchGetExecutor(self, **executor_args) as executor:
+            return executor.fetch_unsampled(requests, golden_only)
+
     def __repr__(self) -> str:
         return f"{type(self)} ({self.begin_date.isoformat()} - {self.end_date.isoformat()})"
 
 
 def example_batch_get_requests():
-    directory = f"{ENVI['MAIN_PYSEA_DIR']}alldata/dump/"
+    directory = f"{get_envi()['MAIN_PYSEA_DIR']}alldata/dump/"
     analytics = GoogleAnalyticsBase(
         directory=directory,
         dump_file_prefix="test_case",
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+from copy import deepcopy
+
+from google_analytics.analyticsbase import GoogleAnalyticsBase, logger
+from google_analytics.analyticscache import canonical_json
+
+
+# https://developers.google.com/analytics/devguides/reporting/core/v4/rest/v4/reports/batchGet
+# все запросы одного batchGet обязаны совпадать по этим полям
+BATCH_COMPATIBILITY_FIELDS = ("viewId", "dateRanges", "samplingLevel", "segments", "cohortGroup")
+MAX_REPORTS_PER_BATCH = 5
+
+
+def batch_key(report_request: dict) -> str:
+    return canonical_json({i: report_request.get(i) for i in BATCH_COMPATIBILITY_FIELDS})
+
+
+class ReportBatcher:
+    """
+    Объединение независимых запросов отчетов в общие batchGet (до 5 отчетов на вызов).
+
+    Совместимые запросы (одинаковые viewId, dateRanges, samplingLevel, segments, cohortGroup) упаковываются вместе,
+    каждый отчет листается по собственному nextPageToken: на следующем шаге в пакет попадают только
+    отчеты, у которых остались страницы. Каждый вызывающий получает только свой отчет.
+
+    batcher = ReportBatcher(analytics)
+    a = batcher.add(report_request_a)
+    b = batcher.add(report_request_b)
+    reports = batcher.flush()  # {a: report, b: report}
+    """
+    def __init__(self, analytics: GoogleAnalyticsBase, golden_only: bool = False,
+                 max_per_batch: int = MAX_REPORTS_PER_BATCH, executor=None) -> None:
+        """
+        :param analytics: экземпляр, через который выполняются запросы
+        :param golden_only: см. GoogleAnalyticsBase.batch_get_requests
+        :param max_per_batch: отчетов в одном batchGet, не более 5
+        :param executor: BatchGetExecutor для параллельного выполнения пакетов (по умолчанию последовательно)
+        """
+        self.analytics = analytics
+        self.golden_only = golden_only
+        self.max_per_batch = min(max_per_batch, MAX_REPORTS_PER_BATCH)
+        self.executor = executor
+        self._queue = {}
+        self._next_ticket = 0
+
+    def add(self, report_request: dict) -> int:
+        """
+        Ставит запрос отчета (элемент reportRequests) в очередь
+
+        :return: номер, по которому отчет возвращается из flush
+        """
+        ticket = self._next_ticket
+        self._next_ticket += 1
+        self._queue[ticket] = deepcopy(report_request)
+        self._queue[ticket].pop("pageToken", None)
+        return ticket
+
+    def _batches(self, pending: dict) -> list:
+        groups = {}
+        for ticket, report_request in pending.items():
+            groups.setdefault(batch_key(report_request), []).append(ticket)
+        return [tickets[i:i + self.max_per_batch]
+                for tickets in groups.values() for i in range(0, len(tickets), self.max_per_batch)]
+
+    def _execute(self, bodies: list) -> list:
+        if self.executor is not None:
+            return self.executor.map(bodies, self.golden_only)
+        return [self.analytics.batch_get_requests(i, self.golden_only) for i in bodies]
+
+    def flush(self) -> dict:
+        """
+        Выполняет все запросы из очереди
+
+        :return: {номер: отчет со строками всех страниц}
+        """
+        pending, self._queue = self._queue, {}
+        results, calls = {}, 0
+        while pending:
+            batches = self._batches(pending)
+            bodies = [{'reportRequests': [pending[t] for t in tickets]} for tickets in batches]
+            if self.analytics.use_resource_quotas:
+                for body in bodies:
+                    body['useResourceQuotas'] = True
+            calls += len(bodies)
+
+            for tickets, response in zip(batches, self._execute(bodies)):
+                for ticket, report in zip(tickets, response['reports']):
+                    if ticket not in results:
+                        results[ticket] = report
+                        report['data'].setdefault("rows", [])
+                    else:
+                        results[ticket]['data']['rows'].extend(report['data'].get("rows", []))
+                    token = report.get('nextPageToken', False)
+                    if token:
+                        pending[ticket]['pageToken'] = token
+                    else:
+                        results[ticket].pop('nextPageToken', None)
+                        del pending[ticket]
+
+        logger.info(f"{len(results)} отчетов получено за {calls} вызовов batchGet")
+        return results
+
+    def fetch(self, report_requests: list) -> list:
+        """
+        :param report_requests: элементы reportRequests
+        :return: отчеты в порядке запросов
+        """
+        tickets = [self.add(i) for i in report_requests]
+        results = self.flush()
+        return [results[i] for i in tickets]
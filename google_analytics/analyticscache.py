@@ -2,12 +2,31 @@ import os
 import hashlib
 import tempfile
 import pickle
+import json
 from common_constants import constants
-from datetime import date
-ENVI = constants.EnviVar(
-    main_dir="/home/eugene/Yandex.Disk/localsource/google_analytics/",
-    cred_dir="/home/eugene/Yandex.Disk/localsource/credentials/"
-)
+from datetime import date, timedelta
+import re
+import time
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def get_envi() -> constants.EnviVar:
+    """
+    Переменные окружения читаются при первом обращении, а не при импорте модуля
+    """
+    return constants.EnviVar(
+        main_dir="/home/eugene/Yandex.Disk/localsource/google_analytics/",
+        cred_dir="/home/eugene/Yandex.Disk/localsource/credentials/"
+    )
+
+
+def __getattr__(name: str):
+    if name == "ENVI":  # совместимость: analyticscache.ENVI
+        return get_envi()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 logger = constants.logging.getLogger(__name__)
 
 
@@ -63,7 +82,7 @@ class DumpFileDiscoveryCache:
     """
     @staticmethod
     def filename(url):
-        return f'{ENVI["MAIN_PYSEA_DIR"]}alldata/cache/' \
+        return f'{get_envi()["MAIN_PYSEA_DIR"]}alldata/cache/' \
                f'google_api_discovery_{date.today()}_{hashlib.md5(url.encode()).hexdigest()}.pickle'
 
     def get(self, url):
@@ -77,3 +96,272 @@ class DumpFileDiscoveryCache:
         logger.debug(f"DumpFileDiscoveryCache SET: {content}")
         with open(self.filename(url), "wb") as f:
             pickle.dump(content, f, pickle.HIGHEST_PROTOCOL)
+
+
+class TieredDiscoveryCache:
+    """
+    https://github.com/googleapis/google-api-python-client/tree/master/googleapiclient/discovery_cache
+    Двухуровневый кеш discovery-документов: память процесса, затем файл на диске
+    (один файл на URL без даты, запись атомарная).
+
+    Документ на диске действителен max_age секунд с последней проверки (mtime файла); по истечении он
+    запрашивается снова, и если revision не изменилась, файл не перезаписывается, а только отмечается как проверенный.
+    Устаревшие файлы (в т.ч. датированные файлы DumpFileDiscoveryCache) удаляются при записи.
+    """
+    _MEMORY = {}
+
+    def __init__(self, directory: str = None, max_age: float = 7 * 24 * 3600) -> None:
+        self.directory = directory or f'{get_envi()["MAIN_PYSEA_DIR"]}alldata/cache/'
+        self.max_age = max_age
+
+    def filename(self, url):
+        return os.path.join(self.directory, f'google_api_discovery_{hashlib.md5(url.encode()).hexdigest()}.pickle')
+
+    @staticmethod
+    def _revision(content):
+        try:
+            return json.loads(content).get("revision")
+        except (ValueError, AttributeError):
+            return None
+
+    def get(self, url):
+        content = TieredDiscoveryCache._MEMORY.get(url)
+        if content is not None:
+            return content
+        entry = self._load(url)
+        if entry is None or time.time() - entry["checked"] > self.max_age:
+            return None  # пора сверить revision с API
+        TieredDiscoveryCache._MEMORY[url] = entry["content"]
+        return entry["content"]
+
+    def _load(self, url):
+        # время последней проверки документа - mtime файла
+        try:
+            with open(self.filename(url), 'rb') as f:
+                entry = pickle.load(f)
+                entry["checked"] = os.fstat(f.fileno()).st_mtime
+                return entry
+        except FileNotFoundError:
+            return None
+        except Exception as err:
+            logger.warning(f"{err}\n Discovery cache {self.filename(url)} is broken")
+            return None
+
+    def set(self, url, content):
+        revision = self._revision(content)
+        logger.debug(f"TieredDiscoveryCache SET: {url} revision {revision}")
+        TieredDiscoveryCache._MEMORY[url] = content
+        entry = self._load(url)
+        if entry is not None and revision is not None and entry["revision"] == revision:
+            os.utime(self.filename(url))  # документ не изменился - только отмечаем проверку
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        atomic_pickle_dump({"revision": revision, "content": content}, self.filename(url))
+        self.cleanup()
+
+    def cleanup(self) -> None:
+        """
+        Удаляет датированные файлы DumpFileDiscoveryCache и файлы, не проверявшиеся дольше 4 * max_age
+        """
+        now = time.time()
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if not name.startswith("google_api_discovery_"):
+                continue
+            path = os.path.join(self.directory, name)
+            dated = re.match(r"google_api_discovery_\d{4}-\d{2}-\d{2}_", name)
+            try:
+                if dated or now - os.path.getmtime(path) > 4 * self.max_age:
+                    os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+
+def atomic_pickle_dump(obj, file_out: str) -> None:
+    """
+    Атомарная запись pickle: пишем во временный файл в том же каталоге и переименовываем,
+    поэтому при сбое на диске остается либо старая, либо новая версия файла, но не оборванная
+    """
+    atomic_pickle_dump_frames((obj,), file_out)
+
+
+def atomic_pickle_dump_frames(frames, file_out: str) -> None:
+    """
+    Атомарная запись нескольких pickle подряд в один файл (читаются последовательными pickle.load)
+    """
+    directory = os.path.dirname(file_out) or "."
+    with tempfile.NamedTemporaryFile(dir=directory, prefix=".tmp_", delete=False) as f:
+        try:
+            for obj in frames:
+                pickle.dump(obj, f, pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        except BaseException:
+            f.close()
+            os.unlink(f.name)
+            raise
+    os.replace(f.name, file_out)
+
+
+def canonical_json(obj) -> str:
+    return json.dumps(obj, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+def query_fingerprint(report_request: dict) -> str:
+    """
+    Отпечаток запроса отчета (reportRequests[i]) без периода и пагинации:
+    одинаков для всех дней одного и того же запроса
+
+    :param report_request: элемент reportRequests
+    :return: hex-строка
+    """
+    query = {k: v for k, v in report_request.items() if k not in ("dateRanges", "pageToken", "pageSize")}
+    return hashlib.sha1(canonical_json(query).encode()).hexdigest()[:16]
+
+
+def _resolve_date(value: str, today: date) -> str:
+    # относительные даты API (today, yesterday, NdaysAgo) -> YYYY-MM-DD, чтобы ключ кеша не переживал смену суток
+    if value == "today":
+        return today.isoformat()
+    if value == "yesterday":
+        return (today - timedelta(1)).isoformat()
+    match = re.fullmatch(r"(\d+)daysAgo", value)
+    if match:
+        return (today - timedelta(int(match.group(1)))).isoformat()
+    return value
+
+
+def canonical_request(requests: dict, today: date = None) -> dict:
+    """
+    Каноническое тело batchGet для ключа кеша: относительные даты в dateRanges заменены на абсолютные,
+    pageToken приведен к строке. Порядок метрик и измерений сохраняется - он определяет порядок столбцов ответа.
+    """
+    today = today or date.today()
+    result = json.loads(canonical_json(requests))
+    for report_request in result.get("reportRequests", []):
+        for date_range in report_request.get("dateRanges", []):
+            for key in ("startDate", "endDate"):
+                if key in date_range:
+                    date_range[key] = _resolve_date(date_range[key], today)
+        if "pageToken" in report_request:
+            report_request["pageToken"] = str(report_request["pageToken"])
+        if "pageSize" in report_request:
+            report_request["pageSize"] = str(report_request["pageSize"])
+    return result
+
+
+def request_fingerprint(requests: dict) -> str:
+    """
+    Хеш канонического тела batchGet (viewId, dateRanges, metrics, dimensions, фильтры, сегменты, samplingLevel ...)
+    """
+    return hashlib.sha256(canonical_json(canonical_request(requests)).encode()).hexdigest()
+
+
+class ReportCache:
+    """
+    Кеш ответов batchGet с адресацией по содержимому запроса (request_fingerprint), общий для процессов хоста:
+    {directory}/{hash[:2]}/{hash}.pickle
+
+    Golden ответы хранятся бессрочно, остальные - ttl секунд.
+    Размер кеша ограничен max_bytes: при превышении удаляются давно не использованные файлы (LRU по mtime).
+    В файле два pickle подряд: срок хранения (None - бессрочно) и ответ, поэтому срок проверяется без чтения ответа.
+    """
+    def __init__(self, directory: str = None, ttl: float = 3600, max_bytes: int = 512 * 2 ** 20,
+                 evict_every: int = 50) -> None:
+        self.directory = directory or f'{get_envi()["MAIN_PYSEA_DIR"]}alldata/cache/reports/'
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.evict_every = evict_every
+        self._writes = 0
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.pickle")
+
+    def get(self, requests: dict):
+        """
+        :return: ответ batchGet или None, если в кеше нет или срок хранения истек
+        """
+        file_out = self._file(request_fingerprint(requests))
+        try:
+            with open(file_out, "rb") as f:
+                if self._expired(pickle.load(f)):  # срок хранения - первый кадр, ответ читаем только если он не истек
+                    return None
+                result = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as err:
+            logger.warning(f"{err}\n Report cache file {file_out} is broken")
+            return None
+        try:
+            os.utime(file_out)  # отметка использования для LRU
+        except OSError:
+            pass
+        return result
+
+    def set(self, requests: dict, result: dict) -> None:
+        golden = all(i.get('data', {}).get('isDataGolden', False) for i in result.get('reports', []))
+        expires = None if golden else time.time() + self.ttl
+        file_out = self._file(request_fingerprint(requests))
+        os.makedirs(os.path.dirname(file_out), exist_ok=True)
+        atomic_pickle_dump_frames((expires, result), file_out)
+
+        if self._writes % self.evict_every == 0:
+            self.evict()
+        self._writes += 1
+
+    @staticmethod
+    def _expired(expires) -> bool:
+        return expires is not None and expires < time.time()
+
+    @staticmethod
+    def _read_expires(path: str):
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    @staticmethod
+    def _unlink(path: str) -> None:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    def evict(self) -> None:
+        """
+        Удаляет временные файлы, оставшиеся после сбоя, и просроченные (не golden) ответы,
+        затем самые давно использованные файлы, пока размер кеша больше max_bytes
+        """
+        files, total, now = [], 0, time.time()
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if not name.endswith(".pickle"):
+                    # временные файлы незавершенной записи старше часа - мусор после сбоя
+                    if stat.st_mtime < now - 3600:
+                        self._unlink(path)
+                    continue
+                try:
+                    expired = self._expired(self._read_expires(path))
+                except FileNotFoundError:
+                    continue
+                except Exception as err:
+                    logger.warning(f"{err}\n Report cache file {path} is broken, removing it")
+                    expired = True
+                if expired:
+                    self._unlink(path)
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        files.sort()
+        for mtime, size, path in files:
+            if total <= self.max_bytes:
+                break
+            self._unlink(path)
+            total -= size
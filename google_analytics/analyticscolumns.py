@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+from array import array
+from sys import intern
+
+
+# https://developers.google.com/analytics/devguides/reporting/core/v4/rest/v4/reports/batchGet#MetricType
+METRIC_TYPECODES = {
+    'INTEGER': 'q',
+    'FLOAT': 'd',
+    'CURRENCY': 'd',
+    'PERCENT': 'd',
+    'TIME': 'd',
+}
+
+
+class _CategoryIndex(dict):
+    # значение измерения -> код категории, новые значения добавляются при первом обращении
+    def __init__(self) -> None:
+        super().__init__()
+        self.categories = []
+
+    def __missing__(self, key):
+        code = self[key] = len(self.categories)
+        self.categories.append(intern(key))
+        return code
+
+
+class Categorical:
+    """
+    Категориальный столбец измерения: коды строк (array) и список уникальных значений
+    """
+    def __init__(self) -> None:
+        self.codes = array('i')
+        self._index = _CategoryIndex()
+
+    @property
+    def categories(self) -> list:
+        return self._index.categories
+
+    def extend(self, values) -> None:
+        self.codes.extend(map(self._index.__getitem__, values))
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, i) -> str:
+        return self.categories[self.codes[i]]
+
+    def __iter__(self):
+        categories = self.categories
+        return (categories[i] for i in self.codes)
+
+    def __getstate__(self):
+        return self.codes, self.categories
+
+    def __setstate__(self, state):
+        self.codes, categories = state
+        self._index = _CategoryIndex()
+        for i in categories:  # восстанавливаем индекс в прежнем порядке кодов
+            self._index.__missing__(i)
+
+
+class ColumnarReport:
+    """
+    Отчет Analytics Reporting API v4 в столбцовом виде:
+    dimensions - {имя измерения: Categorical},
+    metrics - по набору столбцов на каждый период dateRanges: [{имя показателя: array}],
+    тип массива показателя определяется по metricHeaderEntries (INTEGER -> int64, остальные -> double).
+
+    Заполняется страницами отчета через extend, экспортируется в NumPy или pandas (если установлены).
+    """
+    def __init__(self, column_header: dict) -> None:
+        self.column_header = column_header
+        self.dimension_names = list(column_header.get('dimensions', []))
+        entries = column_header.get('metricHeader', {}).get('metricHeaderEntries', [])
+        self.metric_names = [i['name'] for i in entries]
+        self.metric_types = [i.get('type', 'FLOAT') for i in entries]
+        self.dimensions = {i: Categorical() for i in self.dimension_names}
+        self.metrics = []
+        self.rows = 0
+
+    def _date_range_columns(self, k: int) -> dict:
+        while len(self.metrics) <= k:
+            self.metrics.append({name: array(METRIC_TYPECODES.get(kind, 'd'))
+                                 for name, kind in zip(self.metric_names, self.metric_types)})
+        return self.metrics[k]
+
+    def extend(self, report: dict) -> ColumnarReport:
+        """
+        Добавляет строки одной страницы отчета
+        """
+        rows = report.get('data', {}).get('rows', [])
+        if not rows:
+            return self
+
+        if self.dimension_names:
+            for name, values in zip(self.dimension_names, zip(*(r['dimensions'] for r in rows))):
+                self.dimensions[name].extend(values)
+
+        for k in range(len(rows[0].get('metrics', []))):
+            columns = self._date_range_columns(k)
+            values = zip(*(r['metrics'][k]['values'] for r in rows))
+            for name, kind, column in zip(self.metric_names, self.metric_types, values):
+                convert = int if METRIC_TYPECODES.get(kind) == 'q' else float
+                columns[name].extend(map(convert, column))
+
+        self.rows += len(rows)
+        return self
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def column_names(self) -> list:
+        """
+        Имена столбцов: измерения, затем показатели; показатели второго периода получают суффикс _1 и т.д.
+        """
+        names = list(self.dimension_names)
+        for k in range(len(self.metrics)):
+            names.extend(name if not k else f"{name}_{k}" for name in self.metric_names)
+        return names
+
+    def to_numpy(self) -> dict:
+        """
+        :return: {имя столбца: numpy.ndarray}; измерения - массивы строк (object)
+        """
+        import numpy as np
+
+        result = {}
+        for name, column in self.dimensions.items():
+            result[name] = np.array(column.categories, dtype=object)[np.frombuffer(column.codes, dtype=np.int32)] \
+                if len(column) else np.array([], dtype=object)
+        for k, columns in enumerate(self.metrics):
+            for name, column in columns.items():
+                result[name if not k else f"{name}_{k}"] = np.frombuffer(column, dtype=column.typecode)
+        return result
+
+    def to_pandas(self):
+        """
+        :return: pandas.DataFrame; измерения - категориальные столбцы
+        """
+        import numpy as np
+        import pandas as pd
+
+        data = {}
+        for name, column in self.dimensions.items():
+            data[name] = pd.Categorical.from_codes(np.frombuffer(column.codes, dtype=np.int32),
+                                                   categories=column.categories)
+        for k, columns in enumerate(self.metrics):
+            for name, column in columns.items():
+                data[name if not k else f"{name}_{k}"] = np.frombuffer(column, dtype=column.typecode)
+        return pd.DataFrame(data, columns=self.column_names())
+
+
+def decode_report(report_or_pages) -> ColumnarReport:
+    """
+    Декодирует отчет (report из ответа batchGet) или последовательность его страниц
+    (например, GoogleAnalyticsBase.iter_pages) в ColumnarReport.
+    Страницы обрабатываются по одной, поэтому весь отчет в сыром виде в памяти не держится.
+
+    :param report_or_pages: dict отчета или итерируемый объект страниц
+    :return: ColumnarReport
+    """
+    pages = [report_or_pages] if isinstance(report_or_pages, dict) else report_or_pages
+    result = None
+    for page in pages:
+        if result is None:
+            result = ColumnarReport(page.get('columnHeader', {}))
+        result.extend(page)
+    return result if result is not None else ColumnarReport({})
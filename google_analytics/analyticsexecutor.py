@@ -0,0 +1,283 @@
+from __future__ import annotations
+
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from copy import deepcopy
+from datetime import date, timedelta
+from time import monotonic, sleep
+
+from google_analytics.analyticsbase import GoogleAnalyticsBase, GoogleAnalyticsError, logger, _join_pages, _paginate
+from google_analytics.analyticsretry import CircuitBreaker, RetryBudget, RetryPolicy
+
+
+# показатели, которые можно суммировать по соседним периодам (счетчики событий, сеансов и сумм);
+# прочие (ga:users, доли, средние, ...) при объединении периодов пересчитать по строкам нельзя
+ADDITIVE_METRICS = {
+    'ga:sessions', 'ga:bounces', 'ga:sessionDuration', 'ga:hits', 'ga:newUsers',
+    'ga:pageviews', 'ga:uniquePageviews', 'ga:timeOnPage', 'ga:entrances', 'ga:exits',
+    'ga:screenviews', 'ga:uniqueScreenviews', 'ga:timeOnScreen',
+    'ga:totalEvents', 'ga:uniqueEvents', 'ga:eventValue', 'ga:sessionsWithEvent',
+    'ga:searchUniques', 'ga:searchResultViews', 'ga:searchSessions', 'ga:searchExits', 'ga:searchRefinements',
+    'ga:goalStartsAll', 'ga:goalCompletionsAll', 'ga:goalValueAll', 'ga:goalAbandonsAll',
+    'ga:transactions', 'ga:transactionRevenue', 'ga:transactionShipping', 'ga:transactionTax',
+    'ga:itemQuantity', 'ga:itemRevenue', 'ga:uniquePurchases', 'ga:totalRefunds', 'ga:refundAmount',
+    'ga:impressions', 'ga:adClicks', 'ga:adCost', 'ga:socialInteractions', 'ga:userTimingValue',
+    'ga:userTimingSample', 'ga:pageLoadTime', 'ga:pageLoadSample', 'ga:exceptions', 'ga:fatalExceptions',
+}
+# ga:goal{N}Starts, ga:goal{N}Completions, ga:goal{N}Value, ga:goal{N}Abandons
+ADDITIVE_METRIC_PATTERN = re.compile(r"ga:goal\d+(Starts|Completions|Value|Abandons)")
+
+
+def is_additive(metric: str) -> bool:
+    return metric in ADDITIVE_METRICS or bool(ADDITIVE_METRIC_PATTERN.fullmatch(metric))
+
+
+def is_sampled(report: dict) -> bool:
+    return bool(report.get('data', {}).get('samplesReadCounts'))
+
+
+def merge_reports(reports: list) -> dict:
+    """
+    Объединяет отчеты одного запроса за соседние периоды в один отчет.
+    Строки с одинаковыми измерениями сливаются, аддитивные показатели (ADDITIVE_METRICS) суммируются.
+    Прочие (ga:users, доли, средние ...) по строкам пересчитать нельзя: если строки или итоги периодов
+    пересекаются, такие столбцы исключаются из отчета целиком (из columnHeader, строк и итогов),
+    а их имена попадают в data.nonAdditiveMetrics - их нужно запросить за весь период отдельно.
+    Все значения в отчете остаются строками, как в ответе API.
+
+    :param reports: отчеты (reports[0] ответов batchGet) с одинаковым columnHeader
+    :return: объединенный отчет
+    """
+    header = deepcopy(reports[0].get('columnHeader', {}))
+    entries = header.get('metricHeader', {}).get('metricHeaderEntries', [])
+    additive = [is_additive(i.get('name', '')) for i in entries]
+    integer = [i.get('type') == 'INTEGER' for i in entries]
+
+    def add(values, other):
+        return [(str(int(a) + int(b)) if is_int else repr(float(a) + float(b))) if is_add else a
+                for a, b, is_add, is_int in zip(values, other, additive, integer)]
+
+    rows, overlapped = {}, False
+    for report in reports:
+        for row in report.get('data', {}).get('rows', []):
+            key = tuple(row.get('dimensions', []))
+            if key not in rows:
+                rows[key] = deepcopy(row)
+                continue
+            overlapped = True
+            for merged, metric in zip(rows[key]['metrics'], row.get('metrics', [])):
+                merged['values'] = add(merged['values'], metric['values'])
+
+    data = {
+        'rows': list(rows.values()),
+        'rowCount': len(rows),
+        'isDataGolden': all(i['data'].get('isDataGolden', False) for i in reports),
+    }
+    totals = [i['data']['totals'] for i in reports if i['data'].get('totals')]
+    if totals:
+        data['totals'] = deepcopy(totals[0])
+        for other in totals[1:]:
+            for merged, metric in zip(data['totals'], other):
+                merged['values'] = add(merged['values'], metric['values'])
+        overlapped = overlapped or len(totals) > 1
+
+    sampled = [i['data'] for i in reports if is_sampled(i)]
+    if sampled:
+        data['samplesReadCounts'] = [str(sum(int(i['samplesReadCounts'][0]) for i in sampled))]
+        data['samplingSpaceSizes'] = [str(sum(int(i['samplingSpaceSizes'][0]) for i in sampled))]
+
+    non_additive = [i['name'] for i, is_add in zip(entries, additive) if not is_add]
+    if overlapped and non_additive:
+        keep = [n for n, is_add in enumerate(additive) if is_add]
+        header['metricHeader']['metricHeaderEntries'] = [entries[n] for n in keep]
+        for metric in [j for i in data['rows'] for j in i['metrics']] + data.get('totals', []):
+            metric['values'] = [metric['values'][n] for n in keep]
+        data['nonAdditiveMetrics'] = non_additive
+        logger.warning(f"Неаддитивные показатели {non_additive} исключены при объединении периодов")
+    return {'columnHeader': header, 'data': data}
+
+
+class Throttle:
+    """
+    Ограничение частоты запросов (не более qps запросов в секунду на весь процесс)
+    с адаптивным замедлением по resourceQuotasRemaining из ответов API:
+    когда остаток часовых или суточных токенов падает ниже reserve, интервал между запросами удваивается,
+    пока квота в норме - постепенно возвращается к базовому.
+    """
+    def __init__(self, qps: float = 10.0, reserve: int = 1000, max_interval: float = 60.0) -> None:
+        self.base_interval = 1 / qps if qps > 0 else 0.0
+        self.interval = self.base_interval
+        self.reserve = reserve
+        self.max_interval = max_interval
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        with self._lock:  # резервируем слот под замком, а спим уже без него
+            now = monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            sleep(slot - now)
+
+    def adapt(self, quotas: dict = None) -> None:
+        if not quotas:
+            return
+        remaining = min(quotas.get('hourlyQuotaTokensRemaining', self.reserve),
+                        quotas.get('dailyQuotaTokensRemaining', self.reserve))
+        with self._lock:
+            if remaining < self.reserve:
+                self.interval = min(max(self.interval * 2, self.base_interval, 0.1), self.max_interval)
+                logger.warning(f"Квота на исходе ({quotas}), интервал между запросами {self.interval:.2f} с")
+            else:
+                self.interval = max(self.interval * 0.9, self.base_interval)
+
+
+class BatchGetExecutor:
+    """
+    Параллельное выполнение независимых запросов batchGet на пуле потоков.
+
+    У каждого потока свой авторизованный клиент API (httplib2 не потокобезопасен),
+    одновременно выполняется не более max_concurrent запросов, частота ограничена qps,
+    при нехватке квоты запросы замедляются (см. Throttle).
+    Временные ошибки повторяются по политике retry (по умолчанию RetryPolicy с общим для исполнителя
+    лимитом повторов и размыкателем цепи).
+
+    with BatchGetExecutor(analytics, max_workers=8) as executor:
+        results = executor.map(requests_list)
+    """
+    def __init__(self, analytics: GoogleAnalyticsBase,
+                 max_workers: int = 4,
+                 max_concurrent: int = None,
+                 qps: float = 10.0,
+                 quota_reserve: int = 1000,
+                 retry=None) -> None:
+        self.analytics = analytics
+        self.throttle = Throttle(qps, quota_reserve)
+        self._semaphore = threading.BoundedSemaphore(max_concurrent or max_workers)
+        self._local = threading.local()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ga-batch")
+        if retry is None:  # лимит повторов и размыкатель общие для всех запросов исполнителя
+            retry = RetryPolicy(budget=RetryBudget(), breaker=CircuitBreaker())
+        self._call = retry(self._call_once)
+
+    def _client(self):
+        if getattr(self._local, "service", None) is None:
+            self._local.service = self.analytics._initialize_analytics_service("v4")
+        return self._local.service
+
+    def _call_once(self, requests: dict, golden_only: bool) -> dict:
+        with self._semaphore:
+            self.throttle.wait()
+            result = self.analytics.batch_get_requests(requests, golden_only, analytics=self._client())
+        self.throttle.adapt(result.get('resourceQuotasRemaining'))
+        return result
+
+    def _fetch_report(self, requests: dict, golden_only: bool, split_sampled: bool = False):
+        # все страницы первого отчета запроса в одном потоке, каждая страница - через _call;
+        # при split_sampled выборка проверяется по первой странице, и если она есть - возвращается None
+        # без выгрузки остальных страниц (период будет разделен)
+        requests = deepcopy(requests)
+        first = self._call(requests, golden_only)
+        if split_sampled and is_sampled(first['reports'][0]):
+            return None
+
+        def fetch(token):
+            if token is None:
+                return first
+            requests["reportRequests"][0]["pageToken"] = token
+            return self._call(requests, golden_only)
+
+        return _join_pages(data['reports'][0] for data in _paginate(fetch))
+
+    def submit_report(self, requests: dict, golden_only: bool = False):
+        """
+        :return: Future с первым отчетом запроса, собранным по всем страницам
+        """
+        return self._pool.submit(self._fetch_report, requests, golden_only)
+
+    def fetch_unsampled(self, requests: dict, golden_only: bool = False) -> dict:
+        """
+        Выгружает отчет без выборки: если первая страница ответа содержит выборку (samplesReadCounts),
+        остальные страницы не выгружаются, период делится пополам и половины запрашиваются параллельно,
+        пока выборка не исчезнет или период не сократится до одного дня (все страницы выгружаются только
+        для периодов без выборки и однодневных). Результаты объединяются через merge_reports.
+
+        :param requests: тело batchGet с одним отчетом и одним периодом в абсолютных датах
+        :return: ответ в формате batchGet с одним объединенным отчетом
+        """
+        report_request = requests["reportRequests"][0]
+        if len(requests["reportRequests"]) != 1 or len(report_request.get("dateRanges", [])) != 1:
+            raise GoogleAnalyticsError("Разбиение по периодам поддерживается для одного отчета с одним dateRanges")
+        date_range = report_request["dateRanges"][0]
+        begin, end = date.fromisoformat(date_range['startDate']), date.fromisoformat(date_range['endDate'])
+
+        def body(span_begin, span_end):
+            result = deepcopy(requests)
+            result["reportRequests"][0]["dateRanges"] = [
+                {'startDate': span_begin.isoformat(), 'endDate': span_end.isoformat()}]
+            result["reportRequests"][0].pop("pageToken", None)
+            return result
+
+        pending, done = [(begin, end)], []
+        while pending:
+            futures = {self._pool.submit(self._fetch_report, body(*i), golden_only, i[0] < i[1]): i
+                       for i in pending}
+            pending = []
+            try:
+                for future in as_completed(futures):
+                    report, (span_begin, span_end) = future.result(), futures[future]
+                    if report is None:
+                        middle = span_begin + timedelta((span_end - span_begin).days // 2)
+                        logger.info(f"Выборка в периоде {span_begin} - {span_end}, делим пополам")
+                        pending.extend([(span_begin, middle), (middle + timedelta(1), span_end)])
+                        continue
+                    if is_sampled(report):
+                        logger.warning(f"SAMPLING: выборка осталась даже за один день {span_begin}")
+                    done.append((span_begin, report))
+            finally:  # при ошибке еще не начатые запросы периодов не нужны
+                for future in futures:
+                    future.cancel()
+
+        done.sort(key=lambda x: x[0])
+        return {'reports': [merge_reports([i[1] for i in done])]}
+
+    def submit(self, requests: dict, golden_only: bool = False):
+        """
+        :return: concurrent.futures.Future с ответом batchGet
+        """
+        return self._pool.submit(self._call, requests, golden_only)
+
+    def map(self, requests_list: list, golden_only: bool = False) -> list:
+        """
+        :return: ответы в порядке запросов; если запрос завершился ошибкой, еще не начатые запросы отменяются
+        """
+        futures = [self.submit(i, golden_only) for i in requests_list]
+        try:
+            return [i.result() for i in futures]
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def as_completed(self, requests_list: list, golden_only: bool = False):
+        """
+        Генератор (номер запроса, ответ) в порядке завершения запросов;
+        если перестать читать его раньше, еще не начатые запросы отменяются
+        """
+        futures = {self.submit(i, golden_only): num for num, i in enumerate(requests_list)}
+        try:
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._pool.shutdown(wait=wait)
+
+    def __enter__(self) -> BatchGetExecutor:
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.shutdown(wait=exc_type is None)
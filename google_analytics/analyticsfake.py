@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import json
+import random
+import threading
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import sleep
+
+from google_analytics.analyticscache import canonical_request
+
+
+class FakeReportingService:
+    """
+    Локальная замена клиента analyticsreporting v4 для тестов и бенчмарков:
+    service.reports().batchGet(body=...).execute() возвращает синтетический отчет.
+
+    Строки генерируются детерминированно и постранично (весь отчет в памяти не строится):
+    для измерения ga:date - rows_per_day строк на каждый день периода, иначе total_rows строк.
+    Значения прочих измерений - разряды номера строки в системе счисления по основанию cardinality,
+    поэтому наборы измерений в отчете (в пределах дня) не повторяются; строк не больше,
+    чем таких наборов (cardinality в степени числа измерений).
+    Показатели с Rate/avg/per в имени получают тип PERCENT/TIME/FLOAT, остальные INTEGER.
+
+    :param rows_per_day: строк на день при измерении ga:date
+    :param total_rows: строк в отчете без ga:date
+    :param cardinality: число различных значений прочих измерений
+    :param latency: задержка ответа, секунд
+    :param sampling_days: отчеты длиннее стольких дней возвращаются с выборкой (None - без выборки)
+    :param error_rate: доля запросов, завершающихся HTTP 503
+    :param seed: зерно генератора ошибок
+    """
+    def __init__(self, rows_per_day: int = 100, total_rows: int = 1000, cardinality: int = 1000,
+                 latency: float = 0.0, sampling_days: int = None, error_rate: float = 0.0, seed: int = 0) -> None:
+        self.rows_per_day = rows_per_day
+        self.total_rows = total_rows
+        self.cardinality = cardinality
+        self.latency = latency
+        self.sampling_days = sampling_days
+        self.error_rate = error_rate
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def reports(self) -> FakeReportingService:
+        return self
+
+    def batchGet(self, body: dict) -> _FakeRequest:
+        return _FakeRequest(self, body)
+
+    @staticmethod
+    def _metric_type(name: str) -> str:
+        if "Rate" in name or "Percent" in name:
+            return "PERCENT"
+        if "avg" in name and "Duration" in name:
+            return "TIME"
+        if "avg" in name or "per" in name:
+            return "FLOAT"
+        return "INTEGER"
+
+    def _report(self, report_request: dict) -> dict:
+        dimensions = [i['name'] for i in report_request.get('dimensions', [])]
+        metrics = [i['expression'] for i in report_request.get('metrics', [])]
+        types = [self._metric_type(i) for i in metrics]
+        date_ranges = report_request.get('dateRanges', [{'startDate': 'yesterday', 'endDate': 'yesterday'}])
+        begin = date.fromisoformat(date_ranges[0]['startDate'])
+        end = date.fromisoformat(date_ranges[0]['endDate'])
+        days = (end - begin).days + 1
+
+        with_date = 'ga:date' in dimensions
+        cardinality = max(self.cardinality, 1)
+        combinations = cardinality ** sum(1 for i in dimensions if i != 'ga:date')
+        per_day = min(self.rows_per_day, combinations)
+        total = per_day * days if with_date else min(self.total_rows, combinations)
+        start = int(report_request.get('pageToken') or 0)
+        size = min(int(report_request.get('pageSize', 1000)), 100000)
+        stop = min(total, start + size)
+
+        rows = []
+        for n in range(start, stop):
+            values, digits = [], n % per_day if with_date else n
+            for name in dimensions:
+                if name == 'ga:date':
+                    values.append((begin + timedelta(n // per_day)).strftime("%Y%m%d"))
+                else:
+                    digits, digit = divmod(digits, cardinality)
+                    values.append(f"{name[3:]}_{digit}")
+            row_metrics = []
+            for k in range(len(date_ranges)):
+                row_metrics.append({'values': [str(n % 97 + k) if kind == "INTEGER" else repr((n % 89) / 7)
+                                               for kind in types]})
+            rows.append({'dimensions': values, 'metrics': row_metrics})
+
+        data = {'rows': rows, 'rowCount': total, 'isDataGolden': end < date.today() - timedelta(1)}
+        if self.sampling_days is not None and days > self.sampling_days:
+            data['samplesReadCounts'] = [str(500000)]
+            data['samplingSpaceSizes'] = [str(1000000)]
+        report = {
+            'columnHeader': {
+                'dimensions': dimensions,
+                'metricHeader': {'metricHeaderEntries': [{'name': i, 'type': t} for i, t in zip(metrics, types)]},
+            },
+            'data': data,
+        }
+        if stop < total:
+            report['nextPageToken'] = str(stop)
+        return report
+
+    def execute(self, body: dict) -> dict:
+        with self._lock:
+            self.calls += 1
+            failed = self._random.random() < self.error_rate
+        if self.latency:
+            sleep(self.latency)
+        if failed:
+            from googleapiclient.errors import HttpError
+            from httplib2 import Response
+            raise HttpError(Response({'status': 503}), b'{"error": {"code": 503, "message": "Backend Error"}}')
+
+        body = canonical_request(body)
+        return {
+            'reports': [self._report(i) for i in body['reportRequests']],
+            'resourceQuotasRemaining': {'dailyQuotaTokensRemaining': 10 ** 6, 'hourlyQuotaTokensRemaining': 10 ** 5},
+        }
+
+
+class _FakeRequest:
+    def __init__(self, service: FakeReportingService, body: dict) -> None:
+        self.service = service
+        self.body = body
+
+    def execute(self) -> dict:
+        return self.service.execute(self.body)
+
+
+class FakeReportingServer:
+    """
+    HTTP-сервер на localhost с тем же генератором отчетов: POST /v4/reports:batchGet.
+    Подходит для AsyncGoogleAnalyticsBase(endpoint=server.endpoint, access_token="fake").
+
+    with FakeReportingServer(FakeReportingService(latency=0.05)) as server:
+        ...
+    """
+    def __init__(self, service: FakeReportingService = None, port: int = 0) -> None:
+        self.service = service or FakeReportingService()
+        service = self.service
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                try:
+                    status, result = 200, service.execute(body)
+                except Exception as err:
+                    status, result = int(getattr(getattr(err, 'resp', None), 'status', 500)), {'error': str(err)}
+                content = json.dumps(result).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, *argp):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.endpoint = f"http://127.0.0.1:{self.httpd.server_address[1]}/v4/reports:batchGet"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self) -> FakeReportingServer:
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import cProfile
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from time import perf_counter, time
+
+
+class JsonLinesSink:
+    """
+    Пишет каждое событие отдельной строкой JSON: {"ts", "kind", "name", "value", "labels"}
+    """
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+
+    def emit(self, kind: str, name: str, value: float, labels: dict) -> None:
+        line = json.dumps({"ts": time(), "kind": kind, "name": name, "value": value, "labels": labels},
+                          ensure_ascii=False)
+        with self._lock, open(self.path, "a") as file:
+            file.write(line + "\n")
+
+    def flush(self) -> None:
+        pass
+
+
+class PrometheusTextSink:
+    """
+    Накапливает счетчики и суммы замеров времени, flush атомарно записывает их
+    в текстовом формате Prometheus (для node_exporter textfile collector)
+    """
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def emit(self, kind: str, name: str, value: float, labels: dict) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            if kind == "counter":
+                self.values[(name, key)] = self.values.get((name, key), 0) + value
+            else:
+                self.values[(f"{name}_sum", key)] = self.values.get((f"{name}_sum", key), 0) + value
+                self.values[(f"{name}_count", key)] = self.values.get((f"{name}_count", key), 0) + 1
+
+    def flush(self) -> None:
+        with self._lock:
+            lines = []
+            for (name, key), value in sorted(self.values.items()):
+                labels = ",".join(f'{k}="{str(v)}"' for k, v in key)
+                lines.append(f"{name}{{{labels}}} {value}" if labels else f"{name} {value}")
+        directory = os.path.dirname(self.path) or "."
+        with tempfile.NamedTemporaryFile("w", dir=directory, prefix=".tmp_", delete=False) as file:
+            file.write("\n".join(lines) + "\n")
+        os.replace(file.name, self.path)
+
+
+class Metrics:
+    """
+    Замеры и счетчики библиотеки (запросы batchGet, страницы, строки, байты, кеши, повторы, выборка).
+    Пока приемник не задан (set_sink), вызовы ничего не делают.
+    """
+    def __init__(self) -> None:
+        self.sink = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.sink is not None
+
+    def set_sink(self, sink) -> None:
+        if self.sink is not None:
+            self.sink.flush()
+        self.sink = sink
+
+    def incr(self, name: str, value: float = 1, **labels) -> None:
+        if self.sink is not None:
+            self.sink.emit("counter", name, value, labels)
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        if self.sink is not None:
+            self.sink.emit("summary", name, value, labels)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        if self.sink is None:
+            yield
+            return
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, perf_counter() - started, **labels)
+
+    def flush(self) -> None:
+        if self.sink is not None:
+            self.sink.flush()
+
+
+METRICS = Metrics()
+
+
+@contextmanager
+def profile_job(path: str):
+    """
+    Профилирует блок кода через cProfile и сохраняет статистику в path (смотреть pstats или snakeviz)
+
+    with profile_job("nightly.prof"):
+        job.run()
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
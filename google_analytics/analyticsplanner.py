@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+from google_analytics.analyticsbase import GoogleAnalyticsBase, GoogleAnalyticsError, logger
+from google_analytics.analyticsbatch import ReportBatcher
+from google_analytics.analyticscache import canonical_json
+
+
+# https://developers.google.com/analytics/devguides/reporting/core/v4/limits-quotas
+MAX_METRICS_PER_REQUEST = 10
+MAX_DIMENSIONS_PER_REQUEST = 9
+MAX_DATE_RANGES_PER_REQUEST = 2
+# измерения времени, которые не нужны, если требуются итоги за период
+TIME_DIMENSIONS = ("ga:date", "ga:dateHour", "ga:dateHourMinute", "ga:year", "ga:month", "ga:week", "ga:day",
+                   "ga:hour", "ga:minute", "ga:yearMonth", "ga:yearWeek", "ga:isoWeek", "ga:isoYearIsoWeek",
+                   "ga:dayOfWeek", "ga:dayOfWeekName", "ga:nthDay", "ga:nthWeek", "ga:nthMonth")
+
+
+def _date_range(span) -> dict:
+    if isinstance(span, dict):
+        return {'startDate': span['startDate'], 'endDate': span['endDate']}
+    begin, end = span
+    return {'startDate': str(begin), 'endDate': str(end)}
+
+
+def _chunks(items: list, size: int) -> list:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+class ReportSpec:
+    """
+    Логическое описание отчета без привязки к запросам API: что нужно вызывающему, а не как это получить.
+
+    spec = ReportSpec(["ga:sessions", "ga:bounceRate"], ["ga:source"], [("2020-01-01", "2020-01-31")],
+                      filters=[{'dimensionName': 'ga:medium', 'operator': 'EXACT', 'expressions': ['organic']}])
+    """
+    def __init__(self, metrics, dimensions=(), date_ranges=None, filters=(), totals: bool = False,
+                 view_id: str = None, sampling_level: str = None) -> None:
+        """
+        :param metrics: показатели (expression)
+        :param dimensions: измерения
+        :param date_ranges: периоды [(begin, end)] или [{'startDate', 'endDate'}], по умолчанию период analytics
+        :param filters: фильтры измерений в формате API (объединяются по AND в dimensionFilterClauses)
+        :param totals: нужны итоги за период - измерения времени (ga:date ...) исключаются из запроса,
+                       суммирование выполняет API (в том числе для неаддитивных показателей вроде ga:bounceRate)
+        :param view_id: представление, по умолчанию analytics.view_id
+        :param sampling_level: samplingLevel запроса, по умолчанию не задается (как в запросах без планировщика)
+        """
+        self.metrics = list(dict.fromkeys(metrics))
+        self.dimensions = [i for i in dict.fromkeys(dimensions) if not (totals and i in TIME_DIMENSIONS)]
+        self.date_ranges = [_date_range(i) for i in date_ranges] if date_ranges else None
+        self.filters = list(filters)
+        self.totals = totals
+        self.view_id = view_id
+        self.sampling_level = sampling_level
+        if not self.metrics:
+            raise GoogleAnalyticsError("В отчете должен быть хотя бы один показатель")
+        if len(self.dimensions) > MAX_DIMENSIONS_PER_REQUEST:
+            raise GoogleAnalyticsError(f"Не более {MAX_DIMENSIONS_PER_REQUEST} измерений в отчете")
+
+    def __repr__(self) -> str:
+        return f"ReportSpec({self.metrics}, {self.dimensions}, {self.date_ranges})"
+
+
+class QueryPlanner:
+    """
+    Планировщик запросов: набор ReportSpec превращается в минимальное число запросов reportRequests.
+
+    - отчеты с одинаковыми представлением, измерениями (в любом порядке), фильтрами и samplingLevel
+      объединяются: показатели сливаются до 10 в запросе, периоды - до 2 dateRanges в запросе
+    - при totals измерения времени не запрашиваются, итоги считает API, а не локальное суммирование строк
+    - фильтры передаются в dimensionFilterClauses, лишние строки не выгружаются
+    - запросы выполняются через ReportBatcher (совместимые по 5 в одном batchGet, со всеми страницами),
+      результат разбирается обратно: каждый ReportSpec получает отчет в формате API только со своими
+      измерениями, показателями и периодами
+
+    reports = QueryPlanner(analytics).run([spec_a, spec_b])
+    """
+    def __init__(self, analytics: GoogleAnalyticsBase, golden_only: bool = False, executor=None) -> None:
+        """
+        :param analytics: экземпляр, через который выполняются запросы
+        :param golden_only: см. GoogleAnalyticsBase.batch_get_requests
+        :param executor: BatchGetExecutor для параллельного выполнения пакетов (по умолчанию последовательно)
+        """
+        self.analytics = analytics
+        self.golden_only = golden_only
+        self.executor = executor
+
+    def _group_key(self, spec: ReportSpec) -> str:
+        return canonical_json({
+            "viewId": spec.view_id or self.analytics.view_id,
+            "dimensions": sorted(spec.dimensions),
+            "filters": sorted(canonical_json(i) for i in spec.filters),
+            "samplingLevel": spec.sampling_level,
+        })
+
+    def _date_ranges(self, spec: ReportSpec) -> list:
+        return spec.date_ranges or [_date_range((self.analytics.begin_date, self.analytics.end_date))]
+
+    def plan(self, specs: list) -> tuple:
+        """
+        :param specs: список ReportSpec
+        :return: (элементы reportRequests, размещение) - для каждого ReportSpec, каждого его периода и показателя
+                 (номер запроса, номер периода в запросе, номер показателя в запросе)
+        """
+        groups = {}
+        for n, spec in enumerate(specs):
+            groups.setdefault(self._group_key(spec), []).append(n)
+
+        requests, located = [], {}
+        for key, members in groups.items():
+            first = specs[members[0]]
+            ranges = {}
+            for n in members:
+                for i in self._date_ranges(specs[n]):
+                    ranges.setdefault(canonical_json(i), i)
+
+            for pair in _chunks(list(ranges), MAX_DATE_RANGES_PER_REQUEST):
+                metrics = {}
+                for n in members:
+                    if any(canonical_json(i) in pair for i in self._date_ranges(specs[n])):
+                        metrics.update(dict.fromkeys(specs[n].metrics))
+
+                for chunk in _chunks(list(metrics), MAX_METRICS_PER_REQUEST):
+                    request = {
+                        'viewId': first.view_id or self.analytics.view_id,
+                        'dateRanges': [ranges[i] for i in pair],
+                        'metrics': [{'expression': i} for i in chunk],
+                        'dimensions': [{'name': i} for i in first.dimensions],
+                        'pageSize': 10000,
+                    }
+                    if first.sampling_level:
+                        request['samplingLevel'] = first.sampling_level
+                    if first.filters:
+                        request['dimensionFilterClauses'] = [{'operator': 'AND', 'filters': first.filters}]
+                    for position, date_range in enumerate(pair):
+                        for column, metric in enumerate(chunk):
+                            located[(key, date_range, metric)] = (len(requests), position, column)
+                    requests.append(request)
+
+        placement = [[[located[(self._group_key(spec), canonical_json(date_range), metric)]
+                       for metric in spec.metrics]
+                      for date_range in self._date_ranges(spec)]
+                     for spec in specs]
+        return requests, placement
+
+    @staticmethod
+    def _split(spec: ReportSpec, placement: list, requests: list, reports: list) -> dict:
+        """
+        Собирает отчет одного ReportSpec из ответов на объединенные запросы
+
+        Строки, в которых все показатели этого отчета нулевые, отбрасываются, как это делает API
+        (они появляются только из-за показателей других отчетов, объединенных в тот же запрос).
+        """
+        n_ranges, n_metrics = len(placement), len(spec.metrics)
+        cells = {}
+        for r, metrics in enumerate(placement):
+            for m, (request, position, column) in enumerate(metrics):
+                cells.setdefault(request, []).append((r, m, position, column))
+
+        rows, totals, types, golden = {}, [["0"] * n_metrics for _ in range(n_ranges)], [None] * n_metrics, True
+        for request, targets in cells.items():
+            report = reports[request]
+            names = [i['name'] for i in requests[request]['dimensions']]
+            order = [names.index(i) for i in spec.dimensions]
+            entries = report['columnHeader']['metricHeader']['metricHeaderEntries']
+            data = report['data']
+            golden = golden and data.get('isDataGolden', False)
+            for r, m, position, column in targets:
+                types[m] = entries[column].get('type')
+                if data.get('totals'):
+                    totals[r][m] = data['totals'][position]['values'][column]
+
+            for row in data.get('rows', []):
+                dimensions = row.get('dimensions', [])
+                key = tuple(dimensions[i] for i in order)
+                values = rows.get(key)
+                if values is None:
+                    values = rows[key] = [["0"] * n_metrics for _ in range(n_ranges)]
+                for r, m, position, column in targets:
+                    values[r][m] = row['metrics'][position]['values'][column]
+
+        data = {
+            'rows': [{'dimensions': list(key), 'metrics': [{'values': i} for i in values]}
+                     for key, values in rows.items() if any(float(v) for i in values for v in i)],
+            'totals': [{'values': i} for i in totals],
+            'isDataGolden': golden,
+        }
+        data['rowCount'] = len(data['rows'])
+        return {
+            'columnHeader': {
+                'dimensions': list(spec.dimensions),
+                'metricHeader': {'metricHeaderEntries': [{'name': i, 'type': t} for i, t in zip(spec.metrics, types)]},
+            },
+            'data': data,
+        }
+
+    def run(self, specs: list) -> list:
+        """
+        :param specs: список ReportSpec
+        :return: отчеты в формате API в порядке specs (dateRanges каждого отчета - в порядке его периодов)
+        """
+        requests, placement = self.plan(specs)
+        logger.info(f"{len(specs)} отчетов выполняются {len(requests)} запросами")
+        reports = ReportBatcher(self.analytics, self.golden_only, executor=self.executor).fetch(requests)
+        return [self._split(spec, i, requests, reports) for spec, i in zip(specs, placement)]
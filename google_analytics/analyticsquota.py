@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+import os
+import sqlite3
+from datetime import datetime, timedelta
+from time import sleep, time
+
+import pytz
+
+from google_analytics.analyticsbase import GoogleAnalyticsError, logger
+from google_analytics.analyticscache import get_envi
+
+
+# суточные квоты API сбрасываются в полночь по тихоокеанскому времени
+QUOTA_TIMEZONE = pytz.timezone("America/Los_Angeles")
+
+
+def _quota_now() -> datetime:
+    return datetime.now(QUOTA_TIMEZONE)
+
+
+class QuotaExhaustedError(GoogleAnalyticsError): pass
+
+
+class QuotaLedger:
+    """
+    Учет квот API в SQLite, общий для процессов хоста:
+    - usage: количество запросов по областям (project:..., view:...) за час и за сутки
+    - remaining: последние значения resourceQuotasRemaining по представлениям
+    - buckets: состояние межпроцессных ограничителей частоты (token bucket)
+    """
+    def __init__(self, path: str = None) -> None:
+        self.path = path or f'{get_envi()["MAIN_PYSEA_DIR"]}alldata/cache/quota_ledger.sqlite'
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._connect() as connection:
+            connection.executescript("""
+                CREATE TABLE IF NOT EXISTS usage (scope TEXT, period TEXT, requests INTEGER,
+                                                  PRIMARY KEY (scope, period));
+                CREATE TABLE IF NOT EXISTS remaining (scope TEXT PRIMARY KEY, hourly INTEGER, daily INTEGER,
+                                                      updated REAL);
+                CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL, updated REAL);
+            """)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    @staticmethod
+    def periods(moment: datetime = None) -> tuple:
+        """
+        :param moment: момент времени (по умолчанию сейчас); наивный считается уже тихоокеанским
+        :return: (час, сутки) по тихоокеанскому времени - ключи счетчиков usage
+        """
+        moment = moment or _quota_now()
+        if moment.tzinfo is not None:
+            moment = moment.astimezone(QUOTA_TIMEZONE)
+        return moment.strftime("%Y-%m-%dT%H"), moment.strftime("%Y-%m-%d")
+
+    def record(self, scopes, requests: int = 1) -> None:
+        """
+        Учитывает выполненные запросы в часовых и суточных счетчиках областей
+        """
+        rows = [(scope, period, requests) for scope in scopes for period in self.periods()]
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.executemany("""
+                INSERT INTO usage (scope, period, requests) VALUES (?, ?, ?)
+                ON CONFLICT (scope, period) DO UPDATE SET requests = requests + excluded.requests
+            """, rows)
+            connection.execute("COMMIT")
+        finally:
+            connection.close()
+
+    def usage(self, scope: str, period: str) -> int:
+        with self._connect() as connection:
+            row = connection.execute("SELECT requests FROM usage WHERE scope = ? AND period = ?",
+                                     (scope, period)).fetchone()
+        return row[0] if row else 0
+
+    def update_remaining(self, scope: str, quotas: dict) -> None:
+        with self._connect() as connection:
+            connection.execute("INSERT OR REPLACE INTO remaining VALUES (?, ?, ?, ?)",
+                               (scope, quotas.get('hourlyQuotaTokensRemaining'),
+                                quotas.get('dailyQuotaTokensRemaining'), time()))
+
+    def remaining(self, scope: str):
+        """
+        :return: (hourly, daily, updated) из последнего ответа или None
+        """
+        with self._connect() as connection:
+            return connection.execute("SELECT hourly, daily, updated FROM remaining WHERE scope = ?",
+                                      (scope,)).fetchone()
+
+    def take(self, name: str, rate: float, capacity: float, tokens: float = 1) -> float:
+        """
+        Межпроцессный token bucket: списывает tokens, если они есть
+
+        :return: 0, если токены списаны, иначе сколько секунд подождать
+        """
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")  # блокировка записи на время чтения-изменения
+            row = connection.execute("SELECT tokens, updated FROM buckets WHERE name = ?", (name,)).fetchone()
+            now = time()
+            available = capacity if row is None else min(capacity, row[0] + (now - row[1]) * rate)
+            wait = 0.0
+            if available >= tokens:
+                available -= tokens
+            else:
+                wait = (tokens - available) / rate
+            connection.execute("INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)", (name, available, now))
+            connection.execute("COMMIT")
+        finally:
+            connection.close()
+        return wait
+
+
+class QuotaManager:
+    """
+    Планирование запросов с учетом квот Analytics Reporting API
+    https://developers.google.com/analytics/devguides/reporting/core/v4/limits-quotas
+
+    Перед каждым запросом:
+    - проверяет часовые и суточные лимиты запросов проекта и представлений по общему журналу (QuotaLedger)
+    - если последний ответ сообщил, что часовых/суточных токенов у представления меньше reserve,
+      откладывает запрос до начала следующего часа/суток (не дольше max_defer, иначе QuotaExhaustedError)
+    - ждет токен в межпроцессном ограничителе частоты (qps на проект)
+    После ответа учитывает запрос и сохраняет resourceQuotasRemaining.
+    Часы и сутки считаются по тихоокеанскому времени (America/Los_Angeles), как и сброс квот API.
+    Часовые лимиты запросов (project_hourly_requests, view_hourly_requests) по умолчанию не заданы.
+    """
+    def __init__(self, ledger: QuotaLedger = None, project: str = "default", qps: float = 10.0,
+                 project_daily_requests: int = 50000, view_daily_requests: int = 10000,
+                 project_hourly_requests: int = None, view_hourly_requests: int = None,
+                 reserve: int = 1000, max_defer: float = 3600) -> None:
+        self.ledger = ledger or QuotaLedger()
+        self.project = project
+        self.qps = qps
+        self.project_daily_requests = project_daily_requests
+        self.view_daily_requests = view_daily_requests
+        self.project_hourly_requests = project_hourly_requests
+        self.view_hourly_requests = view_hourly_requests
+        self.reserve = reserve
+        self.max_defer = max_defer
+
+    def _scopes(self, view_ids) -> list:
+        return [f"project:{self.project}"] + [f"view:{i}" for i in view_ids]
+
+    def _defer_until(self, view_ids) -> float:
+        # секунды до момента, когда запрос можно выполнить с точки зрения квот
+        now = _quota_now()
+        next_hour = QUOTA_TIMEZONE.normalize(now + timedelta(hours=1)).replace(minute=0, second=0, microsecond=0)
+        tomorrow = now.date() + timedelta(1)
+        next_day = QUOTA_TIMEZONE.localize(datetime(tomorrow.year, tomorrow.month, tomorrow.day))
+        to_next_hour, to_next_day = (next_hour - now).total_seconds(), (next_day - now).total_seconds()
+        hour, day = self.ledger.periods(now)
+
+        def exceeded(scope, limit, period):
+            return limit is not None and self.ledger.usage(scope, period) >= limit
+
+        wait = 0.0
+        project = f"project:{self.project}"
+        if exceeded(project, self.project_daily_requests, day):
+            wait = max(wait, to_next_day)
+        elif exceeded(project, self.project_hourly_requests, hour):
+            wait = max(wait, to_next_hour)
+        for view_id in view_ids:
+            if exceeded(f"view:{view_id}", self.view_daily_requests, day):
+                wait = max(wait, to_next_day)
+            elif exceeded(f"view:{view_id}", self.view_hourly_requests, hour):
+                wait = max(wait, to_next_hour)
+            remaining = self.ledger.remaining(f"view:{view_id}")
+            if remaining is None:
+                continue
+            hourly, daily, updated = remaining
+            reported_hour, reported_day = self.ledger.periods(datetime.fromtimestamp(updated, QUOTA_TIMEZONE))
+            if daily is not None and daily < self.reserve and reported_day == day:
+                wait = max(wait, to_next_day)
+            elif hourly is not None and hourly < self.reserve and reported_hour == hour:
+                wait = max(wait, to_next_hour)
+        return wait
+
+    def before_request(self, view_ids) -> None:
+        wait = self._defer_until(view_ids)
+        if wait > self.max_defer:
+            raise QuotaExhaustedError(f"Квота представлений {list(view_ids)} исчерпана, "
+                                      f"восстановится через {wait:.0f} с")
+        if wait:
+            logger.warning(f"Квота представлений {list(view_ids)} на исходе, откладываем запрос на {wait:.0f} с")
+            sleep(wait)
+
+        while True:
+            wait = self.ledger.take(f"qps:{self.project}", self.qps, self.qps)
+            if not wait:
+                return
+            sleep(wait)
+
+    def after_response(self, view_ids, response: dict) -> None:
+        self.ledger.record(self._scopes(view_ids))
+        quotas = response.get('resourceQuotasRemaining')
+        if quotas:
+            for view_id in view_ids:
+                self.ledger.update_remaining(f"view:{view_id}", quotas)
@@ -0,0 +1,224 @@
+from __future__ import annotations
+
+import asyncio
+import random
+import sys
+import threading
+from email.utils import parsedate_to_datetime
+from functools import wraps
+from http.client import RemoteDisconnected
+from socket import timeout
+from time import monotonic, sleep, time
+
+from google_analytics.analyticsbase import LimitOfRetryError, logger
+from google_analytics.analyticsmetrics import METRICS
+
+
+# https://developers.google.com/analytics/devguides/reporting/core/v4/errors
+RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+RETRYABLE_403_REASONS = ("rateLimitExceeded", "userRateLimitExceeded", "quotaExceeded", "backendError")
+CONNECTION_ERRORS = (ConnectionError, RemoteDisconnected, timeout, asyncio.TimeoutError)
+
+
+class RetryBudgetExceeded(LimitOfRetryError): pass
+
+
+class RetryBudget:
+    """
+    Общий на задачу лимит повторов: когда повторы исчерпаны, очередная ошибка сразу пробрасывается
+    (RetryBudgetExceeded), а не ждет еще n попыток в каждом потоке
+    """
+    def __init__(self, max_retries: int = 100) -> None:
+        self.max_retries = max_retries
+        self.spent = 0
+        self._lock = threading.Lock()
+
+    def spend(self) -> None:
+        with self._lock:
+            if self.spent >= self.max_retries:
+                raise RetryBudgetExceeded(f"Исчерпан лимит повторов задачи: {self.max_retries}")
+            self.spent += 1
+
+
+class CircuitBreaker:
+    """
+    После failure_threshold ошибок подряд цепь размыкается: новые попытки (в том числе повторы) ждут
+    reset_timeout секунд, затем пропускается один пробный запрос, остальные ждут его результата.
+    Успех пробы закрывает цепь, ошибка снова размыкает. Запросы не отклоняются, а только приостанавливаются.
+    """
+    def __init__(self, failure_threshold: int = 10, reset_timeout: float = 120, probe_interval: float = 1.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.probe_interval = probe_interval
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self._lock = threading.Lock()
+
+    def before(self) -> float:
+        """
+        :return: сколько секунд подождать перед попыткой (0 - выполнять сейчас)
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return 0
+            remaining = self.opened_at + self.reset_timeout - monotonic()
+            if remaining > 0:
+                return remaining
+            if self.probing:  # пробный запрос уже выполняется
+                return self.probe_interval
+            self.probing = True
+            return 0
+
+    def release(self) -> None:
+        # попытка завершилась ошибкой, которая ничего не говорит о доступности API: проба не засчитывается
+        with self._lock:
+            self.probing = False
+
+    def success(self) -> None:
+        with self._lock:
+            self.failures, self.opened_at, self.probing = 0, None, False
+
+    def failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.warning(f"Слишком много ошибок подряд, запросы приостановлены на {self.reset_timeout} с")
+                self.opened_at = monotonic()
+            self.probing = False
+
+
+def _is_instance(err, module: str, name: str) -> bool:
+    """
+    isinstance без импорта тяжелых модулей (googleapiclient, urllib3):
+    если модуль еще не загружен, его исключение возникнуть не могло
+    """
+    loaded = sys.modules.get(module)
+    return loaded is not None and isinstance(err, getattr(loaded, name))
+
+
+def _status(err):
+    if _is_instance(err, "googleapiclient.errors", "HttpError"):
+        return int(err.resp.status)
+    return getattr(err, "status", None)
+
+
+def _headers(err) -> dict:
+    if _is_instance(err, "googleapiclient.errors", "HttpError"):
+        return err.resp
+    return getattr(err, "headers", None) or {}
+
+
+class RetryPolicy:
+    """
+    Политика повторов запросов к API:
+    - повторяются только временные ошибки: соединение, таймауты, HTTP 429/5xx и 403 с причиной rate limit;
+      остальные HTTP ошибки (400, 401, 403 ...) пробрасываются сразу
+    - задержка берется из заголовка Retry-After, иначе full jitter: случайная в [0, min(max_delay, base_delay*2^i)]
+    - необязательные общий лимит повторов (RetryBudget) и размыкатель цепи (CircuitBreaker)
+
+    Используется как декоратор синхронных функций и корутин.
+    """
+    def __init__(self, retries: int = 12, base_delay: float = 10, max_delay: float = 300,
+                 budget: RetryBudget = None, breaker: CircuitBreaker = None) -> None:
+        if retries < 0 or base_delay < 0 or max_delay < 0:
+            raise ValueError("retries, base_delay и max_delay не могут быть отрицательными")
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.breaker = breaker
+
+    @staticmethod
+    def retryable(err: BaseException) -> bool:
+        status = _status(err)
+        if status is None:
+            return isinstance(err, CONNECTION_ERRORS) or _is_instance(err, "urllib3.exceptions", "ProtocolError") \
+                or type(err).__module__.startswith("aiohttp")
+        if status in RETRYABLE_STATUSES:
+            return True
+        if status == 403:
+            content = getattr(err, "content", b"")
+            content = content.decode(errors="replace") if isinstance(content, bytes) else str(content)
+            return any(i in content for i in RETRYABLE_403_REASONS)
+        return False
+
+    def delay(self, try_number: int, err: BaseException = None) -> float:
+        headers = _headers(err) if err is not None else {}
+        retry_after = headers.get("retry-after") or headers.get("Retry-After")
+        if retry_after:
+            try:
+                return min(float(retry_after), self.max_delay)
+            except ValueError:
+                try:
+                    return min(max(parsedate_to_datetime(retry_after).timestamp() - time(), 0), self.max_delay)
+                except (TypeError, ValueError):
+                    pass
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** try_number))
+
+    def _on_error(self, err: BaseException, try_number: int) -> float:
+        # решает судьбу ошибки: пробрасывает ее или возвращает паузу перед следующей попыткой
+        if not self.retryable(err):
+            if self.breaker is not None:
+                self.breaker.release()
+            raise err
+        if self.breaker is not None:
+            self.breaker.failure()
+        logger.error(f"Ошибка соединения с сервером {err}. Осталось попыток {self.retries - try_number}")
+        if try_number >= self.retries:
+            raise LimitOfRetryError(f"Исчерпаны попытки соединения: {err}") from err
+        if self.budget is not None:
+            self.budget.spend()
+        delay = self.delay(try_number, err)
+        METRICS.incr("ga_retries_total", status=_status(err) or type(err).__name__)
+        METRICS.incr("ga_retry_sleep_seconds_total", delay)
+        return delay
+
+    def _on_success(self) -> None:
+        if self.breaker is not None:
+            self.breaker.success()
+
+    def call(self, f, *argp, **argn):
+        try_number = 0
+        while True:
+            pause = self.breaker.before() if self.breaker is not None else 0
+            if pause:  # цепь разомкнута: ждем и проверяем снова
+                sleep(pause)
+                continue
+            try:
+                result = f(*argp, **argn)
+            except Exception as err:
+                sleep(self._on_error(err, try_number))
+                try_number += 1
+            else:
+                self._on_success()
+                return result
+
+    async def acall(self, f, *argp, **argn):
+        try_number = 0
+        while True:
+            pause = self.breaker.before() if self.breaker is not None else 0
+            if pause:
+                await asyncio.sleep(pause)
+                continue
+            try:
+                result = await f(*argp, **argn)
+            except Exception as err:
+                await asyncio.sleep(self._on_error(err, try_number))
+                try_number += 1
+            else:
+                self._on_success()
+                return result
+
+    def __call__(self, f):
+        if asyncio.iscoroutinefunction(f):
+            @wraps(f)
+            async def constructed_coroutine(*argp, **argn):
+                return await self.acall(f, *argp, **argn)
+            return constructed_coroutine
+
+        @wraps(f)
+        def constructed_function(*argp, **argn):
+            return self.call(f, *argp, **argn)
+        return constructed_function
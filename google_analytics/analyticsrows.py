@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+from array import array
+from sys import intern
+
+
+class CompactRow:
+    """
+    Строка отчета: кортеж значений измерений и кортежи значений показателей по периодам
+    """
+    __slots__ = ('dimensions', 'metrics')
+
+    def __init__(self, dimensions: tuple, metrics: tuple) -> None:
+        self.dimensions = dimensions
+        self.metrics = metrics
+
+    def __repr__(self) -> str:
+        return f"CompactRow({self.dimensions}, {self.metrics})"
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, CompactRow) and (self.dimensions, self.metrics) == (other.dimensions, other.metrics)
+
+
+class CompactReport:
+    """
+    Компактное хранение отчета Analytics Reporting API v4 вместо списка словарей rows:
+    - измерения строки - один кортеж интернированных строк (одинаковые кортежи разделяются)
+    - все показатели - один array('d') построчно: строка * период * показатель
+    Сериализуется (pickle) как словарь значений измерений по столбцам с кодами и массивы байт.
+
+    Преобразование из/в формат API: from_api / to_api. Значения показателей хранятся как числа,
+    поэтому в to_api INTEGER возвращаются целыми строками, остальные - через repr(float).
+    """
+    __slots__ = ('column_header', 'data', 'metric_types', 'ranges', '_dimensions', '_values', '_tuples')
+
+    def __init__(self, column_header: dict, data: dict = None) -> None:
+        self.column_header = column_header
+        self.data = {k: v for k, v in (data or {}).items() if k != 'rows'}  # totals, isDataGolden и прочее
+        entries = column_header.get('metricHeader', {}).get('metricHeaderEntries', [])
+        self.metric_types = tuple(i.get('type', 'FLOAT') for i in entries)
+        self.ranges = 0
+        self._dimensions = []
+        self._values = array('d')
+        self._tuples = {}
+
+    @classmethod
+    def from_api(cls, report: dict) -> CompactReport:
+        """
+        :param report: отчет из ответа batchGet (reports[i])
+        """
+        result = cls(report.get('columnHeader', {}), report.get('data', {}))
+        result.extend(report.get('data', {}).get('rows', []))
+        return result
+
+    def extend(self, rows: list) -> CompactReport:
+        """
+        Добавляет строки в формате API
+        """
+        if not rows:
+            return self
+        if not self.ranges:
+            self.ranges = len(rows[0].get('metrics', []))
+        tuples, dimensions, values = self._tuples, self._dimensions, self._values
+        for row in rows:
+            key = tuple(map(intern, row.get('dimensions', [])))
+            dimensions.append(tuples.setdefault(key, key))
+            for metric in row.get('metrics', []):
+                values.extend(map(float, metric['values']))
+        return self
+
+    @property
+    def width(self) -> int:
+        return len(self.metric_types)
+
+    def __len__(self) -> int:
+        return len(self._dimensions)
+
+    def __getitem__(self, i: int) -> CompactRow:
+        if i < 0:
+            i += len(self)
+        step = self.width * self.ranges
+        flat = self._values[i * step:(i + 1) * step]
+        metrics = tuple(tuple(flat[k * self.width:(k + 1) * self.width]) for k in range(self.ranges))
+        return CompactRow(self._dimensions[i], metrics)
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def _format(self, values) -> list:
+        return [str(int(v)) if kind == 'INTEGER' else repr(v) for v, kind in zip(values, self.metric_types)]
+
+    def rows(self) -> list:
+        """
+        Строки в формате API
+        """
+        return [{'dimensions': list(row.dimensions), 'metrics': [{'values': self._format(i)} for i in row.metrics]}
+                for row in self]
+
+    def to_api(self) -> dict:
+        """
+        Отчет в формате API
+        """
+        return {'columnHeader': self.column_header, 'data': {**self.data, 'rows': self.rows()}}
+
+    def __getstate__(self):
+        columns = list(zip(*self._dimensions)) if self._dimensions else []
+        encoded = []
+        for column in columns:  # словарное кодирование столбцов измерений
+            index = {}
+            codes = array('I', (index.setdefault(i, len(index)) for i in column))
+            encoded.append((list(index), codes.tobytes()))
+        return (self.column_header, self.data, self.ranges, len(self._dimensions), encoded, self._values.tobytes())
+
+    def __setstate__(self, state):
+        self.column_header, self.data, self.ranges, count, encoded, values = state
+        entries = self.column_header.get('metricHeader', {}).get('metricHeaderEntries', [])
+        self.metric_types = tuple(i.get('type', 'FLOAT') for i in entries)
+        self._values = array('d')
+        self._values.frombytes(values)
+        self._tuples = {}
+        columns = []
+        for categories, codes_bytes in encoded:
+            categories = [intern(i) for i in categories]
+            codes = array('I')
+            codes.frombytes(codes_bytes)
+            columns.append([categories[i] for i in codes])
+        rows = zip(*columns) if columns else (() for _ in range(count))
+        self._dimensions = [self._tuples.setdefault(i, i) for i in rows]
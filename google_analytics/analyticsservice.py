@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import threading
+from datetime import datetime, timedelta
+
+import httplib2
+from googleapiclient import discovery
+
+from google_analytics import analyticscache
+from google_analytics.analyticscache import logger
+
+
+class ServiceFactory:
+    """
+    Общая для процесса фабрика клиентов Google API.
+
+    Учетные данные создаются один раз на (ключ, scopes) и заранее обновляются за refresh_margin секунд
+    до истечения токена - одно обновление на всех пользователей.
+    Авторизованный httplib2.Http (keep-alive соединение) и построенный клиент API кешируются на поток,
+    т.к. httplib2 не потокобезопасен: экземпляры и рабочие потоки получают готового клиента без пересборки.
+    Discovery-документ разбирается один раз на процесс, остальные потоки строят клиента из готового документа.
+    """
+    def __init__(self, refresh_margin: float = 300, timeout: float = 300) -> None:
+        self.refresh_margin = refresh_margin
+        self.timeout = timeout
+        self._credentials = {}
+        self._documents = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def credentials(self, key, create):
+        """
+        :param key: ключ учетных данных, например (путь к файлу ключа, scopes)
+        :param create: функция без аргументов, создающая учетные данные при первом обращении
+        :return: учетные данные с действующим токеном
+        """
+        with self._lock:
+            credentials = self._credentials.get(key)
+            if credentials is None:
+                credentials = self._credentials[key] = create()
+            self._refresh_if_needed(credentials)
+        return credentials
+
+    def _refresh_if_needed(self, credentials) -> None:
+        expiry = getattr(credentials, "token_expiry", None)
+        if credentials.access_token is None or expiry is None \
+                or expiry - datetime.utcnow() < timedelta(seconds=self.refresh_margin):
+            logger.debug("Обновляем токен доступа Google API")
+            credentials.refresh(httplib2.Http(timeout=self.timeout))
+
+    def access_token(self, key, create) -> str:
+        return self.credentials(key, create).access_token
+
+    def service(self, key, create, api: str, version: str) -> discovery.Resource:
+        """
+        Клиент API для текущего потока
+
+        :param key: ключ учетных данных
+        :param create: функция, создающая учетные данные
+        :param api: имя API, например analyticsreporting
+        :param version: версия API, например v4
+        """
+        credentials = self.credentials(key, create)
+        services = self._local.__dict__.setdefault("services", {})
+        service = services.get((key, api, version))
+        if service is None:
+            http = credentials.authorize(httplib2.Http(timeout=self.timeout))
+            document = self._documents.get((api, version))
+            if document is not None:  # разобранный discovery-документ общий для потоков процесса
+                service = discovery.build_from_document(document, http=http)
+            else:
+                service = discovery.build(api, version, http=http, cache=analyticscache.TieredDiscoveryCache())
+                document = getattr(service, "_rootDesc", None)
+                if document is not None:
+                    with self._lock:
+                        self._documents[(api, version)] = document
+            services[(key, api, version)] = service
+        return service
+
+    def clear(self) -> None:
+        with self._lock:
+            self._credentials.clear()
+            self._documents.clear()
+        self._local.__dict__.pop("services", None)
+
+
+FACTORY = ServiceFactory()
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import json
+import os
+import pickle
+import shutil
+from datetime import date
+
+from google_analytics.analyticscache import atomic_pickle_dump, logger
+
+
+class SpilledRows:
+    """
+    Строки отчета, сброшенные на диск (JSON lines): читаются лениво при итерации.
+    Срез (rows[a:b], шаг 1) - такой же ленивый набор строк, индекс (rows[i]) читает одну строку.
+    При сериализации (например, dump_to поверх spill_to) строки материализуются и загружаются списком:
+    каталог выгрузки удаляется на следующий день (remove_spills), и ссылка на него в дампе стала бы недействительной.
+    """
+    def __init__(self, path: str, count: int, start: int = 0) -> None:
+        self.path = path
+        self.count = count
+        self.start = start
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __iter__(self):
+        stop = self.start + self.count
+        with open(os.path.join(self.path, SpillFile.ROWS), "rb") as file:
+            for n, line in enumerate(file):
+                if n >= stop:
+                    return
+                if n >= self.start:
+                    yield json.loads(line)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            begin, end, step = i.indices(self.count)
+            if step != 1:
+                raise ValueError("SpilledRows поддерживает только срезы с шагом 1")
+            return SpilledRows(self.path, max(end - begin, 0), self.start + begin)
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError("SpilledRows index out of range")
+        return next(iter(SpilledRows(self.path, 1, self.start + i)))
+
+    def __reduce__(self):
+        return list, (list(self),)
+
+
+def remove_spills(base: str, keep: str) -> None:
+    """
+    Удаляет каталоги выгрузок {base}*.spill, кроме keep: выгрузки прошлых дней уже не продолжаются
+    (в имени каталога дата), завершенные только занимают место.
+    Дампы поверх spill_to на такие каталоги не ссылаются - SpilledRows сериализуется списком строк
+
+    :param base: общий префикс пути каталогов ({directory}/{dump_file_prefix}_{prefix}_)
+    :param keep: путь текущего каталога выгрузки
+    """
+    directory, name = os.path.split(base)
+    try:
+        names = os.listdir(directory or ".")
+    except FileNotFoundError:
+        return
+    for i in names:
+        path = os.path.join(directory, i)
+        if not (i.startswith(name) and i.endswith(".spill")) or os.path.normpath(path) == os.path.normpath(keep):
+            continue
+        try:  # между префиксом и .spill - только дата, иначе это выгрузка другого префикса
+            date.fromisoformat(i[len(name):-len(".spill")])
+        except ValueError:
+            continue
+        logger.info(f"Удаляем выгрузку прошлого дня {path}")
+        shutil.rmtree(path, ignore_errors=True)
+
+
+class SpillFile:
+    """
+    Каталог постраничной выгрузки: rows.jsonl - строки всех полученных страниц,
+    state.pickle - сколько страниц/строк/байт записано, nextPageToken следующей страницы и признак завершения.
+
+    Страница сначала дописывается и сбрасывается на диск, затем атомарно обновляется состояние,
+    поэтому после сбоя rows.jsonl обрезается до последней записанной страницы и выгрузка продолжается с ее токена.
+    """
+    ROWS = "rows.jsonl"
+    STATE = "state.pickle"
+    EMPTY = {"token": None, "pages": 0, "rows": 0, "offset": 0, "done": False}
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.state = dict(self.EMPTY)
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def resume(self) -> dict:
+        """
+        Загружает состояние и отбрасывает хвост недописанной страницы
+
+        :return: состояние выгрузки
+        """
+        os.makedirs(self.path, exist_ok=True)
+        try:
+            with open(self._file(self.STATE), "rb") as file:
+                self.state = pickle.load(file)
+        except FileNotFoundError:
+            self.state = dict(self.EMPTY)
+        except Exception as err:
+            logger.warning(f"{err}\n Spill state {self.path} is broken, starting over")
+            self.state = dict(self.EMPTY)
+        with open(self._file(self.ROWS), "ab") as file:
+            file.truncate(self.state["offset"])
+        if self.state["pages"] and not self.state["done"]:
+            logger.info(f"Продолжаем выгрузку {self.path} со страницы {self.state['pages'] + 1}")
+        return self.state
+
+    def reset(self) -> None:
+        self.state = dict(self.EMPTY)
+        with open(self._file(self.ROWS), "wb"):
+            pass
+        atomic_pickle_dump(self.state, self._file(self.STATE))
+
+    def append_page(self, rows: list, next_token) -> None:
+        with open(self._file(self.ROWS), "ab") as file:
+            for row in rows:
+                file.write(json.dumps(row, ensure_ascii=False, separators=(",", ":")).encode())
+                file.write(b"\n")
+            file.flush()
+            os.fsync(file.fileno())
+            offset = file.tell()
+        self.state = {"token": next_token or None, "pages": self.state["pages"] + 1,
+                      "rows": self.state["rows"] + len(rows), "offset": offset, "done": not next_token}
+        atomic_pickle_dump(self.state, self._file(self.STATE))
+
+    def rows(self) -> SpilledRows:
+        return SpilledRows(self.path, self.state["rows"])
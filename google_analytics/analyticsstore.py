@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import os
+import pickle
+from datetime import date, timedelta
+
+from google_analytics.analyticscache import atomic_pickle_dump, logger
+
+
+class DayPartitionStore:
+    """
+    Кеш отчетов, разбитый по дням: один файл на день в каталоге
+    {directory}/{prefix}/{view_id}/{fingerprint}/YYYY-MM-DD.pickle,
+    где fingerprint - отпечаток запроса без периода (analyticscache.query_fingerprint).
+
+    Запись дня атомарна и не зависит от размера кеша, чтение ленивое - загружаются только запрошенные дни.
+    """
+    def __init__(self, directory: str, prefix: str, view_id: str, fingerprint: str) -> None:
+        self.path = os.path.join(directory, prefix, str(view_id), fingerprint)
+
+    def _file(self, day: date) -> str:
+        return os.path.join(self.path, f"{day.isoformat()}.pickle")
+
+    def days(self) -> set:
+        """
+        Множество сохраненных дней
+        """
+        try:
+            names = os.listdir(self.path)
+        except FileNotFoundError:
+            return set()
+        result = set()
+        for name in names:
+            if name.endswith(".pickle") and not name.startswith("."):
+                try:
+                    result.add(date.fromisoformat(name[:-len(".pickle")]))
+                except ValueError:
+                    pass
+        return result
+
+    def __contains__(self, day: date) -> bool:
+        return os.path.exists(self._file(day))
+
+    def missing_dates(self, begin: date, end: date) -> list:
+        stored = self.days()
+        return [begin + timedelta(i) for i in range((end - begin).days + 1) if begin + timedelta(i) not in stored]
+
+    def load(self, day: date):
+        """
+        :return: отчет за день или None, если дня нет или файл поврежден
+        """
+        try:
+            with open(self._file(day), "rb") as file:
+                return pickle.load(file)
+        except FileNotFoundError:
+            return None
+        except Exception as err:
+            logger.warning(f"{err}\n Partition {self._file(day)} is broken, it will be fetched again")
+            return None
+
+    def load_range(self, begin: date, end: date, exclude=()):
+        """
+        Генератор (date, report) по сохраненным дням периода [begin, end] в порядке дат
+
+        :param exclude: дни, которые не нужно загружать (например, уже есть в памяти)
+        """
+        stored = self.days()
+        day = begin
+        while day <= end:
+            if day in stored and day not in exclude:
+                report = self.load(day)
+                if report is not None:
+                    yield day, report
+            day += timedelta(1)
+
+    def save(self, day: date, report) -> None:
+        os.makedirs(self.path, exist_ok=True)
+        atomic_pickle_dump(report, self._file(day))
+
+    def save_many(self, entries) -> None:
+        """
+        :param entries: кортежи (date, report)
+        """
+        for day, report in entries:
+            self.save(day, report)
@@ -41,5 +41,8 @@ setuptools.setup(
         'six>=1.15.0',
         'uritemplate>=3.0.1',
         'urllib3>=1.25.9',
-    ]
+    ],
+    extras_require={
+        'async': ['aiohttp>=3.6'],
+    },
 )
\ No newline at end of file
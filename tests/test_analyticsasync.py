@@ -0,0 +1,136 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("aiohttp")
+
+from google_analytics.analyticsasync import AsyncGoogleAnalyticsBase, AsyncHttpError, async_connection_attempts
+from google_analytics.analyticsbase import LimitOfRetryError
+from google_analytics.analyticsfake import FakeReportingServer, FakeReportingService
+
+
+def body(page_size: int) -> dict:
+    return {'reportRequests': [{
+        'viewId': "111",
+        'dateRanges': [{'startDate': "2020-01-01", 'endDate': "2020-01-10"}],
+        'metrics': [{'expression': 'ga:sessions'}],
+        'dimensions': [{'name': 'ga:date'}, {'name': 'ga:source'}],
+        'pageSize': page_size,
+    }]}
+
+
+def test_aiter_rows_follows_page_tokens():
+    service = FakeReportingService(rows_per_day=25)
+
+    async def collect(endpoint):
+        async with AsyncGoogleAnalyticsBase(endpoint=endpoint, access_token="fake", cache=False) as analytics:
+            return [row async for row in analytics.aiter_rows(body(page_size=40))]
+
+    with FakeReportingServer(service) as server:
+        rows = asyncio.run(collect(server.endpoint))
+
+    assert len(rows) == 250
+    assert service.calls == 7  # 250 строк по 40 на страницу
+    assert rows[0]['dimensions'][0] == "20200101" and rows[-1]['dimensions'][0] == "20200110"
+
+
+def test_aiter_pages_does_not_touch_request_body():
+    requests = body(page_size=100)
+
+    async def pages(endpoint):
+        async with AsyncGoogleAnalyticsBase(endpoint=endpoint, access_token="fake", cache=False) as analytics:
+            return [page async for page in analytics.aiter_pages(requests)]
+
+    with FakeReportingServer(FakeReportingService(rows_per_day=25)) as server:
+        assert len(asyncio.run(pages(server.endpoint))) == 3
+    assert "pageToken" not in requests['reportRequests'][0]
+
+
+def test_async_connection_attempts_retries_transient_errors():
+    calls = []
+
+    @async_connection_attempts(n=3, t=0)
+    async def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise AsyncHttpError(503, "Backend Error")
+        return "ok"
+
+    assert asyncio.run(flaky()) == "ok"
+    assert len(calls) == 3
+
+
+def test_async_connection_attempts_gives_up():
+    calls = []
+
+    @async_connection_attempts(n=2, t=0)
+    async def broken():
+        calls.append(1)
+        raise AsyncHttpError(500, "Internal Error")
+
+    with pytest.raises(LimitOfRetryError):
+        asyncio.run(broken())
+    assert len(calls) == 3
+
+
+def test_async_connection_attempts_does_not_retry_bad_request():
+    calls = []
+
+    @async_connection_attempts(n=3, t=0)
+    async def bad_request():
+        calls.append(1)
+        raise AsyncHttpError(400, "Invalid dimension")
+
+    with pytest.raises(AsyncHttpError):
+        asyncio.run(bad_request())
+    assert len(calls) == 1
+
+
+def test_server_errors_are_retried_end_to_end():
+    service = FakeReportingService(rows_per_day=5, error_rate=0.5, seed=3)
+
+    class Analytics(AsyncGoogleAnalyticsBase):
+        @async_connection_attempts(n=20, t=0)
+        async def _post(self, requests: dict) -> dict:
+            return await AsyncGoogleAnalyticsBase._post.__wrapped__(self, requests)
+
+    async def collect(endpoint):
+        async with Analytics(endpoint=endpoint, access_token="fake", cache=False) as analytics:
+            return [row async for row in analytics.aiter_rows(body(page_size=10))]
+
+    with FakeReportingServer(service) as server:
+        rows = asyncio.run(collect(server.endpoint))
+
+    assert len(rows) == 50
+    assert service.calls > 5  # часть запросов завершилась 503 и была повторена
+
+
+def test_quota_manager_counts_async_requests(tmp_path):
+    async def collect(endpoint):
+        async with AsyncGoogleAnalyticsBase(endpoint=endpoint, access_token="fake", cache=False) as analytics:
+            analytics.quota_manager_enable(str(tmp_path / "ledger.sqlite"))
+            rows = [row async for row in analytics.aiter_rows(body(page_size=100))]
+            return rows, analytics.quota
+
+    with FakeReportingServer(FakeReportingService(rows_per_day=25)) as server:
+        rows, quota = asyncio.run(collect(server.endpoint))
+
+    assert len(rows) == 250
+    hour, day = quota.ledger.periods()
+    assert quota.ledger.usage("view:111", day) == 3
+    assert quota.ledger.usage(f"project:{quota.project}", hour) == 3
+
+
+def test_result_cache_serves_repeated_requests(tmp_path):
+    service = FakeReportingService(rows_per_day=5)
+
+    async def twice(endpoint):
+        async with AsyncGoogleAnalyticsBase(endpoint=endpoint, access_token="fake", cache=False) as analytics:
+            analytics.result_cache_enable(str(tmp_path)).resource_quotas_enable()
+            return [await analytics.abatch_get_requests(body(page_size=100)) for _ in range(2)]
+
+    with FakeReportingServer(service) as server:
+        first, second = asyncio.run(twice(server.endpoint))
+
+    assert service.calls == 1
+    assert first == second
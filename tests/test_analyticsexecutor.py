@@ -0,0 +1,116 @@
+import threading
+
+import pytest
+
+from google_analytics.analyticsbase import GoogleAnalyticsBase, GoogleAnalyticsError
+from google_analytics.analyticscolumns import decode_report
+from google_analytics.analyticsexecutor import BatchGetExecutor, merge_reports
+from google_analytics.analyticsfake import FakeReportingService
+from google_analytics.analyticsrows import CompactReport
+
+
+class FakeAnalytics(GoogleAnalyticsBase):
+    def __init__(self, service: FakeReportingService) -> None:
+        super().__init__(cache=False)
+        self.service = service
+
+    def _initialize_analytics_service(self, version: str = "v4"):
+        return self.service
+
+
+def report(rows: list, totals: list) -> dict:
+    return {
+        'columnHeader': {
+            'dimensions': ['ga:source'],
+            'metricHeader': {'metricHeaderEntries': [
+                {'name': 'ga:sessions', 'type': 'INTEGER'},
+                {'name': 'ga:users', 'type': 'INTEGER'},
+                {'name': 'ga:bounceRate', 'type': 'PERCENT'},
+                {'name': 'ga:adCost', 'type': 'CURRENCY'},
+            ]},
+        },
+        'data': {
+            'rows': [{'dimensions': [source], 'metrics': [{'values': values}]} for source, values in rows],
+            'totals': [{'values': totals}] if totals else [],
+            'isDataGolden': True,
+        },
+    }
+
+
+def overlapping() -> list:
+    return [
+        report([("google", ["10", "8", "50.0", "1.5"]), ("yandex", ["4", "4", "25.0", "0.5"])],
+               ["14", "12", "42.8", "2.0"]),
+        report([("google", ["6", "5", "10.0", "2.25"]), ("bing", ["1", "1", "0.0", "0.0"])],
+               ["7", "6", "8.5", "2.25"]),
+    ]
+
+
+def test_overlapping_rows_drop_non_additive_columns():
+    merged = merge_reports(overlapping())
+    entries = merged['columnHeader']['metricHeader']['metricHeaderEntries']
+    assert [i['name'] for i in entries] == ['ga:sessions', 'ga:adCost']
+    assert merged['data']['nonAdditiveMetrics'] == ['ga:users', 'ga:bounceRate']
+
+    rows = {i['dimensions'][0]: i['metrics'][0]['values'] for i in merged['data']['rows']}
+    assert rows == {'google': ["16", "3.75"], 'yandex': ["4", "0.5"], 'bing': ["1", "0.0"]}
+    assert merged['data']['totals'] == [{'values': ["21", "4.25"]}]
+    assert all(isinstance(v, str) for i in merged['data']['rows'] for v in i['metrics'][0]['values'])
+
+
+def test_merged_report_decodes():
+    merged = merge_reports(overlapping())
+
+    columns = decode_report(merged)
+    assert len(columns) == 3
+
+    compact = CompactReport.from_api(merged)
+    assert len(compact) == 3 and compact.width == 2
+
+
+def test_disjoint_rows_keep_all_columns():
+    merged = merge_reports([report([("google", ["10", "8", "50.0", "1.5"])], []),
+                            report([("yandex", ["4", "4", "25.0", "0.5"])], [])])
+    assert len(merged['columnHeader']['metricHeader']['metricHeaderEntries']) == 4
+    assert 'nonAdditiveMetrics' not in merged['data']
+
+
+def test_fetch_unsampled_splits_before_paginating():
+    service = FakeReportingService(rows_per_day=30, sampling_days=4)
+    requests = {'reportRequests': [{
+        'viewId': "111",
+        'dateRanges': [{'startDate': "2020-01-01", 'endDate': "2020-01-08"}],
+        'metrics': [{'expression': 'ga:sessions'}],
+        'dimensions': [{'name': 'ga:date'}, {'name': 'ga:source'}],
+        'pageSize': 10,
+    }]}
+    with BatchGetExecutor(FakeAnalytics(service), qps=0) as executor:
+        merged = executor.fetch_unsampled(requests)['reports'][0]
+
+    assert merged['data']['rowCount'] == 240
+    assert 'samplesReadCounts' not in merged['data']
+    assert service.calls == 1 + 2 * 12  # первая страница с выборкой за 8 дней, затем по 12 страниц на половину
+
+
+class FailingAnalytics(GoogleAnalyticsBase):
+    def __init__(self) -> None:
+        super().__init__(cache=False)
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def _initialize_analytics_service(self, version: str = "v4"):
+        return None
+
+    def batch_get_requests(self, requests: dict, golden_only: bool = False, analytics=None) -> dict:
+        with self.lock:
+            self.calls += 1
+        raise GoogleAnalyticsError("Invalid request")
+
+
+def test_map_cancels_pending_requests_on_error():
+    analytics = FailingAnalytics()
+    executor = BatchGetExecutor(analytics, max_workers=1, qps=0)
+    with pytest.raises(GoogleAnalyticsError):
+        executor.map([{'reportRequests': [{}]} for _ in range(20)])
+    executor.shutdown()  # дожидаемся всего, что успело начаться
+    assert analytics.calls < 20
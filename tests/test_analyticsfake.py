@@ -0,0 +1,25 @@
+from google_analytics.analyticsfake import FakeReportingService
+
+
+def rows(service: FakeReportingService, dimensions: list, end: str = "2020-01-03") -> list:
+    body = {'reportRequests': [{
+        'dateRanges': [{'startDate': "2020-01-01", 'endDate': end}],
+        'metrics': [{'expression': 'ga:sessions'}],
+        'dimensions': [{'name': i} for i in dimensions],
+        'pageSize': 100000,
+    }]}
+    return service.reports().batchGet(body=body).execute()['reports'][0]['data']['rows']
+
+
+def test_dimension_tuples_are_unique():
+    service = FakeReportingService(rows_per_day=60, total_rows=90, cardinality=10)
+    for dimensions in (["ga:date", "ga:source", "ga:medium"], ["ga:source", "ga:medium"]):
+        keys = [tuple(i['dimensions']) for i in rows(service, dimensions)]
+        assert len(keys) == len(set(keys)) == (180 if "ga:date" in dimensions else 90)
+
+
+def test_rows_are_capped_by_combinations():
+    service = FakeReportingService(rows_per_day=60, total_rows=90, cardinality=5)
+    assert len(rows(service, ["ga:date", "ga:source"])) == 3 * 5
+    assert len(rows(service, ["ga:source", "ga:medium"])) == 25
+    assert len(rows(service, ["ga:date"])) == 3
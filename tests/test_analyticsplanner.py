@@ -0,0 +1,73 @@
+import pytest
+
+from google_analytics.analyticsbase import GoogleAnalyticsBase, GoogleAnalyticsError
+from google_analytics.analyticsfake import FakeReportingService
+from google_analytics.analyticsplanner import MAX_DIMENSIONS_PER_REQUEST, QueryPlanner, ReportSpec
+
+JANUARY = ("2020-01-01", "2020-01-31")
+FEBRUARY = ("2020-02-01", "2020-02-29")
+MARCH = ("2020-03-01", "2020-03-31")
+
+
+class FakeAnalytics(GoogleAnalyticsBase):
+    def __init__(self, service: FakeReportingService) -> None:
+        super().__init__(cache=False)
+        self.service = service
+
+    def _initialize_analytics_service(self, version: str = "v4"):
+        return self.service
+
+
+def planner() -> QueryPlanner:
+    return QueryPlanner(FakeAnalytics(FakeReportingService(total_rows=20)))
+
+
+def test_dimension_limit():
+    dimensions = [f"ga:dimension{i}" for i in range(1, MAX_DIMENSIONS_PER_REQUEST + 2)]
+    assert MAX_DIMENSIONS_PER_REQUEST == 9
+    ReportSpec(["ga:sessions"], dimensions[:9])
+    with pytest.raises(GoogleAnalyticsError):
+        ReportSpec(["ga:sessions"], dimensions)
+
+
+def test_metrics_of_compatible_specs_are_merged():
+    metrics = [f"ga:metric{i}" for i in range(1, 13)]
+    specs = [ReportSpec(metrics[:7], ["ga:source"], [JANUARY]),
+             ReportSpec(metrics[5:], ["ga:source"], [JANUARY]),
+             ReportSpec(metrics[:1], ["ga:medium"], [JANUARY])]
+    requests, placement = planner().plan(specs)
+
+    assert len(requests) == 3  # 12 показателей ga:source - 10 + 2, ga:medium отдельно
+    assert [i['expression'] for i in requests[0]['metrics']] == metrics[:10]
+    assert [i['expression'] for i in requests[1]['metrics']] == metrics[10:]
+    assert placement[1][0][-1] == (1, 0, 1)  # ga:metric12 - второй показатель второго запроса
+    assert placement[2][0] == [(2, 0, 0)]
+
+
+def test_two_date_ranges_share_a_request():
+    specs = [ReportSpec(["ga:sessions"], ["ga:source"], [JANUARY]),
+             ReportSpec(["ga:users"], ["ga:source"], [FEBRUARY]),
+             ReportSpec(["ga:users"], ["ga:source"], [MARCH])]
+    requests, placement = planner().plan(specs)
+
+    assert len(requests) == 2
+    assert [i['startDate'] for i in requests[0]['dateRanges']] == ["2020-01-01", "2020-02-01"]
+    assert [i['startDate'] for i in requests[1]['dateRanges']] == ["2020-03-01"]
+    assert placement[0] == [[(0, 0, 0)]] and placement[1] == [[(0, 1, 1)]] and placement[2] == [[(1, 0, 0)]]
+
+
+def test_run_splits_reports_back_per_spec():
+    specs = [ReportSpec(["ga:sessions", "ga:bounceRate"], ["ga:source"], [JANUARY]),
+             ReportSpec(["ga:users"], ["ga:source"], [FEBRUARY])]
+    first, second = planner().run(specs)
+
+    entries = first['columnHeader']['metricHeader']['metricHeaderEntries']
+    assert entries == [{'name': 'ga:sessions', 'type': 'INTEGER'}, {'name': 'ga:bounceRate', 'type': 'PERCENT'}]
+    assert second['columnHeader']['metricHeader']['metricHeaderEntries'] == [{'name': 'ga:users', 'type': 'INTEGER'}]
+
+    # строка source_0 в первом отчете нулевая и отбрасывается, во втором - нет (значения второго периода на 1 больше)
+    assert first['data']['rowCount'] == 19 and second['data']['rowCount'] == 20
+    rows = {i['dimensions'][0]: i['metrics'] for i in first['data']['rows']}
+    assert rows['source_3'] == [{'values': ["3", repr(3 / 7)]}]
+    rows = {i['dimensions'][0]: i['metrics'] for i in second['data']['rows']}
+    assert rows['source_3'] == [{'values': ["4"]}]
@@ -0,0 +1,28 @@
+from datetime import datetime
+
+import pytz
+
+from google_analytics.analyticsquota import QuotaLedger, QuotaManager
+
+
+def test_periods_use_pacific_time():
+    moment = pytz.utc.localize(datetime(2020, 1, 2, 5, 30))
+    assert QuotaLedger.periods(moment) == ("2020-01-01T21", "2020-01-01")
+
+
+def test_hourly_limit_defers_to_next_hour(tmp_path):
+    quota = QuotaManager(QuotaLedger(str(tmp_path / "ledger.sqlite")), view_hourly_requests=2)
+    quota.after_response(["111"], {})
+    assert quota._defer_until(["111"]) == 0
+
+    quota.after_response(["111"], {})
+    assert 0 < quota._defer_until(["111"]) <= 3600
+    assert quota._defer_until(["222"]) == 0
+
+
+def test_daily_limit_defers_to_pacific_midnight(tmp_path):
+    quota = QuotaManager(QuotaLedger(str(tmp_path / "ledger.sqlite")), project_daily_requests=1)
+    quota.after_response(["111"], {})
+    now = datetime.now(pytz.timezone("America/Los_Angeles"))
+    left = 24 * 3600 - (now.hour * 3600 + now.minute * 60 + now.second)
+    assert abs(quota._defer_until(["111"]) - left) < 3600 + 5  # с точностью до перехода на летнее время
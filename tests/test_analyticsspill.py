@@ -0,0 +1,29 @@
+import pickle
+import shutil
+
+from google_analytics.analyticsspill import SpilledRows, SpillFile
+
+
+def spilled(path) -> SpilledRows:
+    spill = SpillFile(str(path))
+    spill.resume()
+    spill.append_page([{'dimensions': [str(i)]} for i in range(3)], "3")
+    spill.append_page([{'dimensions': [str(i)]} for i in range(3, 5)], None)
+    return spill.rows()
+
+
+def test_spilled_rows_are_lazy_and_sliceable(tmp_path):
+    rows = spilled(tmp_path / "rows.spill")
+    assert len(rows) == 5
+    assert rows[-1] == {'dimensions': ["4"]}
+    assert [i['dimensions'][0] for i in rows[1:4]] == ["1", "2", "3"]
+
+
+def test_pickled_rows_survive_removed_spill(tmp_path):
+    rows = spilled(tmp_path / "rows.spill")
+    dumped = pickle.dumps({'all': rows, 'tail': rows[3:]})
+    shutil.rmtree(rows.path)
+
+    loaded = pickle.loads(dumped)
+    assert loaded['all'] == [{'dimensions': [str(i)]} for i in range(5)]
+    assert loaded['tail'] == [{'dimensions': ["3"]}, {'dimensions': ["4"]}]
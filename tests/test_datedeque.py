@@ -0,0 +1,120 @@
+import copy
+import pickle
+import random
+from collections import deque
+from datetime import date, timedelta
+
+import pytest
+
+from google_analytics.analyticsbase import DateDeque
+
+BEGIN = date(2020, 1, 1)
+
+
+def assert_same(dates: DateDeque, model: deque):
+    assert list(dates) == list(model)
+    assert dates.maxlen == model.maxlen
+    days = sorted({i[0] for i in model})
+    assert dates.dates() == days
+    for d in days + [BEGIN - timedelta(1)]:
+        first = next((i for i in model if i[0] == d), None)
+        assert dates.get_by_date(d) == first
+        assert (d in dates) == (first is not None)
+
+
+def test_evicted_duplicate_is_not_returned():
+    a, b, c = (BEGIN, "a"), (BEGIN, "b"), (BEGIN + timedelta(1), "c")
+    dates = DateDeque([a, b], maxlen=2)
+    dates.append(c)
+    assert dates.get_by_date(BEGIN) == b
+
+    dates = DateDeque([c, a], maxlen=2)
+    dates.appendleft(b)
+    assert dates.get_by_date(BEGIN) == b
+
+
+def test_concatenation_and_repetition_keep_index():
+    a, b = (BEGIN, "a"), (BEGIN + timedelta(1), "b")
+    dates = DateDeque([a])
+    for result in (dates + deque([b]), dates * 2, 2 * dates):
+        assert isinstance(result, DateDeque)
+        assert_same(result, deque(result))
+    assert (dates + deque([b])).get_by_date(b[0]) == b
+    assert list(dates) == [a]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_operations_match_plain_deque(seed):
+    rnd = random.Random(seed)
+    maxlen = rnd.choice([None, 1, 3, 8])
+    dates, model = DateDeque(maxlen=maxlen), deque(maxlen=maxlen)
+    counter = iter(range(10 ** 6))
+
+    def item():
+        return BEGIN + timedelta(rnd.randrange(6)), next(counter)
+
+    for _ in range(300):
+        op = rnd.randrange(17)
+        if op in (0, 1):
+            x = item()
+            dates.append(x)
+            model.append(x)
+        elif op == 2:
+            x = item()
+            dates.appendleft(x)
+            model.appendleft(x)
+        elif op == 3:
+            items = [item() for _ in range(rnd.randrange(4))]
+            dates.extend(items)
+            model.extend(items)
+        elif op == 4:
+            items = [item() for _ in range(rnd.randrange(4))]
+            dates.extendleft(items)
+            model.extendleft(items)
+        elif op == 5 and model:
+            assert dates.pop() == model.pop()
+        elif op == 6 and model:
+            assert dates.popleft() == model.popleft()
+        elif op == 7 and model:
+            x = rnd.choice(model)
+            dates.remove(x)
+            model.remove(x)
+        elif op == 8 and len(model) != maxlen:
+            n, x = rnd.randrange(len(model) + 1), item()
+            dates.insert(n, x)
+            model.insert(n, x)
+        elif op == 9 and model:
+            n, x = rnd.randrange(len(model)), item()
+            dates[n] = x
+            model[n] = x
+        elif op == 10 and model:
+            n = rnd.randrange(len(model))
+            del dates[n]
+            del model[n]
+        elif op == 11:
+            n = rnd.randrange(-3, 4)
+            dates.rotate(n)
+            model.rotate(n)
+        elif op == 12:
+            dates.reverse()
+            model.reverse()
+        elif op == 13:
+            items = [item() for _ in range(rnd.randrange(3))]
+            dates += items
+            model += items
+        elif op == 14:
+            n = rnd.randrange(3)
+            if rnd.random() < 0.5:
+                dates, model = dates * n, model * n
+            else:
+                dates *= n
+                model *= n
+        elif op == 15:
+            items = deque(item() for _ in range(rnd.randrange(3)))
+            dates, model = dates + items, model + items
+        elif op == 16:
+            dates = pickle.loads(pickle.dumps(dates)) if rnd.random() < 0.5 else copy.copy(dates)
+        if rnd.random() < 0.02:
+            dates.clear()
+            model.clear()
+        assert_same(dates, model)
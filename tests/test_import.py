@@ -0,0 +1,43 @@
+import os
+import subprocess
+import sys
+
+API_STACK = ("googleapiclient", "oauth2client", "httplib2")
+
+
+def imported_modules(statement: str) -> set:
+    # импорт в чистом интерпретаторе: модули, загруженные текущим процессом pytest, не мешают проверке
+    code = f"import sys; {statement}; print(' '.join(sys.modules))"
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env, check=True)
+    return {i.split(".")[0] for i in out.stdout.split()}
+
+
+def test_analyticsbase_does_not_load_api_stack():
+    loaded = imported_modules("import google_analytics.analyticsbase")
+    assert not loaded & set(API_STACK)
+
+
+def test_cache_only_read_path_does_not_load_api_stack():
+    loaded = imported_modules("from google_analytics.analyticsbase import read_dump; "
+                              "read_dump('/nonexistent', 'prefix', 'data')")
+    assert not loaded & set(API_STACK)
+
+
+def test_retry_decorator_does_not_load_api_stack():
+    loaded = imported_modules("from google_analytics.analyticsbase import GoogleAnalyticsBase, connection_attempts\n"
+                              "class Analytics(GoogleAnalyticsBase):\n"
+                              "    @connection_attempts()\n"
+                              "    def report(self): pass")
+    assert not loaded & set(API_STACK)
+
+
+def test_import_time(record_property):
+    # время импорта в чистом интерпретаторе попадает в отчет pytest (--junitxml); порог - с запасом на медленные машины
+    code = ("import time; t = time.perf_counter(); import google_analytics.analyticsbase; "
+            "print(time.perf_counter() - t)")
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env, check=True)
+    seconds = float(out.stdout.split()[-1])
+    record_property("import_seconds", seconds)
+    assert seconds < 2.0